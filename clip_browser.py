@@ -1,153 +1,68 @@
 from PySide2 import QtWidgets, QtCore, QtGui
 from collections import OrderedDict
 from dataclasses import dataclass
-import os, glob, math
-import ffmpeg
+import os, threading
 import hou
+import hdefereval
+from clip_catalog import ClipCatalog
+from clip_search import ClipSearchIndex
+from preview_cache import previewCache, PreviewPlayer
+import thumbnail_manifest
+from thumbnail_farm import ThumbnailFarm, preview_path
 
 RootPath = "C:/Assets"
 
-class GifGenerator():
-    
-    def __init__(self):
-        self.check_thumbnails()
+class GifGenerator(QtCore.QObject):
+    """Generates the missing thumbnails in the background while the browser is open."""
 
-    def check_thumbnails(self):
-        """Check if all .FBX files have a thumbnail, and if not, generate them."""
-        # Initialize lists and a dictionary.
-        fbx_files, gif_files = [], []
+    # Emitted once the clips are checked, with the ones that need a thumbnail.
+    checked = QtCore.Signal(object)
+    # Emitted for every finished clip with the error, or "" if it worked.
+    clipFinished = QtCore.Signal(object, str)
+    finished = QtCore.Signal()
+
+    def __init__(self, parent=None):
+        super(GifGenerator, self).__init__(parent)
+        # If the clips are rendered in this session, hou must be used from the main thread.
+        self.farm = ThumbnailFarm(hand_off=hdefereval.executeInMainThreadWithResult)
         self.need_thumbnail = []
-        # Iterate the Agent Directory and get its path, subdirectories and files.
-        for path, dirnames, files in os.walk(RootPath + "/Animations"):
-            # Iterate every file in the Agent Directory.
-            for file in files:
-                #If it's the agent skin, don't add it to the list
-                if(os.path.splitext(file)[0] == os.path.basename(path)):
-                    continue
-                
-                # If it's an .FBX, append it to the "fbx_files" list.
-                if file.endswith(".fbx"):
-                    fbx_files.append(os.path.join(path, file))
-    
-                # If it's a .gif, append it to the "gif_files" list.
-                elif file.endswith(".gif"):
-                    gif_files.append(os.path.join(path, file))
-
-        # Iterate every .FBX file in the "fbx_files" list.
-        for fbx_file in fbx_files:
-            # If this .FBX file doesn't have a thumbnail,
-            # store its filename and path in the dictionary.
-            if fbx_file.replace("fbx","gif") not in gif_files:
-                clip = {}
-                clip["clip_name"] = os.path.basename(fbx_file).split(".")[0]
-                clip["clip_path"] = fbx_file.replace("\\", "/")
-                clip["agent_path"] = os.path.dirname(clip["clip_path"]).replace("Animations", "Characters")
-                clip["agent_name"] = os.path.basename(clip["agent_path"])
-                clip["agent_path"] = clip["agent_path"] + "/" + clip["agent_name"] + ".fbx"
-                self.need_thumbnail.append(clip)
-
-        # Run SETUP_SCENE() and SETUP_NODES()
-        # for those .FBX that don't have a thumbnail.
-        if self.need_thumbnail:
-            self.setup_scene()
-            self.setup_nodes()
-            self.reset_scene()
-
-    def setup_nodes(self):
-        # Display a status message in Houdini.
-
-        hou.ui.setStatusMessage("Generating thumbnails. Please wait...",
-                                severity=hou.severityType.ImportantMessage)
-        hou.setFrame(1)
-
-        obj = hou.node("/obj/")
-        # Iterate every item in the "need_thumbnail" dictionary.
-        for clip in self.need_thumbnail:  
-            # Create a Geometry node.
-            geo = obj.createNode("geo",f"agent_{0}".format(clip["agent_name"]))
-
-            # Create an Agent node and point to the .FBX file.
-            agent_node = geo.createNode("agent")
-            agent_node.parm("input").set(2)
-            agent_node.parm("fbxfile").set(clip["agent_path"])
-
-            clip_node = geo.createNode("agentclip::2.0")
-            clip_node.setFirstInput(agent_node)
-            clip_node.parm("source1").set(1)
-            clip_node.parm("file1").set(clip["clip_path"])
-            clip_node.parm("name1").set(clip["clip_name"])
-            clip_node.parm("setcurrentclip").set(True)
-            clip_node.parm("currentclip").set(clip["clip_name"])
-            clip_node.setGenericFlag(hou.nodeFlag.Display, True)
-            clip_node.setGenericFlag(hou.nodeFlag.Render, True)
-
-            # Access the geometry level and generate a bounding box.
-            clip_geo = clip_node.geometry()
-            bbox = clip_geo.boundingBox()
-
-            # Frame the bounding box we just created.
-            self.viewport.frameBoundingBox(bbox)
-
-            # Create a Camera node and set it to a square resolution.
-            cam_node = obj.createNode("cam","cam_{0}".format(clip["agent_name"]))
-            cam_node.parmTuple("res").set((200, 200))
-        
-            # Copy the viewport frame onto the camera.
-            self.viewport.saveViewToCamera(cam_node)
-
-            # Reduce the Ortho Width by 65%.
-            orthowidth = cam_node.parm("orthowidth").eval()
-            cam_node.parm("orthowidth").set(orthowidth*0.65)
-
-            # Create an OpenGL node in /out.
-            out = hou.node("/out/")
-            opengl_node = out.createNode("opengl","openGL_{0}".format(clip["clip_name"]))
-            # Set the Frame Range to the begining and end of the animation.
-            opengl_node.parm("trange").set(1)
-            start_frame = hou.timeToFrame(clip_geo.prims()[0].clipTimes()[0])
-            end_frame = hou.timeToFrame(clip_geo.prims()[0].clips()[0].length())
-            print((start_frame, end_frame))
-            opengl_node.parmTuple("f").set((start_frame, end_frame, 1))
-
-            # Set the output path and file format.
-            opengl_node.parm("camera").set(cam_node.path())
-            opengl_node.parm("picture").set(clip["clip_path"].replace(".fbx", "_$F4.jpeg"))
-            opengl_node.parm("vobjects").set(geo.name())
-            # Run the OpenGL render.
-            opengl_node.parm("execute").pressButton()
-            
-            (
-            ffmpeg.input(clip["clip_path"].replace(".fbx","_%04d.jpeg"), framerate=24)
-            .output(clip["clip_path"].replace(".fbx", ".gif"), vf='split[s0][s1];[s0]palettegen[p];[s1][p]paletteuse', framerate=24)
-            .run(overwrite_output=True)
-            )
-            # Clean up the network and temp files.
-            for i in range(1, math.ceil(end_frame + 1)):
-                try:
-                    os.remove(clip["clip_path"].replace(".fbx", "_{:04d}.jpeg".format(i)))
-                except:
-                    pass
-            geo.destroy()
-            cam_node.destroy()
-            opengl_node.destroy()
-
-    def setup_scene(self):
-        """Turn off the reference grid and set the viewport to Front view."""
-        # Get the Scene Viewer.
-        scene_viewer = hou.ui.paneTabOfType(hou.paneTabType.SceneViewer)
-
-        # Turn off the reference grid.
-        self.grid = scene_viewer.referencePlane()
-        self.grid.setIsVisible(False)
-
-        # Get the Viewport and set it to Front View.
-        self.viewport = scene_viewer.curViewport()
-        self.viewport.changeType(hou.geometryViewportType.Front)
-
-    def reset_scene(self):
-        self.grid.setIsVisible(True)
-        self.viewport.changeType(hou.geometryViewportType.Perspective)
-        self.viewport.frameAll()
+        self.failed = []
+        self.thread = None
+
+    def check_thumbnails(self):
+        """Check if all .FBX files have a thumbnail, and return the ones that need one.
+
+        Stats every clip and hashes the touched ones, so it runs on the background thread.
+        """
+        # Update the catalog, clips overwritten in place included, and get the clips whose thumbnail is missing or out of date.
+        catalog.refresh(deep=True)
+        self.need_thumbnail = [clip for clip in catalog.clips(stale=True) if thumbnail_manifest.is_stale(clip)]
+        return self.need_thumbnail
+
+    def start(self):
+        """Check the thumbnails and render the missing ones on a background thread."""
+        if self.thread is not None:
+            return
+        self.thread = threading.Thread(target=self.generate_thumbnails, daemon=True)
+        self.thread.start()
+
+    def generate_thumbnails(self):
+        # The signals are queued to the main thread, where the browser lives.
+        self.checked.emit(list(self.check_thumbnails()))
+        if not self.need_thumbnail:
+            return
+        def progress(done, total, clip, error):
+            self.clipFinished.emit(clip, error or "")
+        self.failed = self.farm.run(self.need_thumbnail, progress)
+        self.finished.emit()
+
+    def prioritize(self, clip_paths):
+        """Render these clips first, e.g. the ones visible in the browser."""
+        self.farm.prioritize(clip_paths)
+
+    def cancel(self):
+        """Stop handing out clips. The ones being rendered still finish."""
+        self.farm.cancel()
 
     def search_fbx(self):
         """Search for .FBX files and store them in a dictionary."""
@@ -169,137 +84,221 @@ class GifGenerator():
         return self.fbx_dict
 
 
-class AnimatedButton(QtWidgets.QWidget):
-    def __init__(self, text = "", fbxPath = "", width = 200):
-        super(AnimatedButton, self).__init__()
-        
-        self.clipName = os.path.basename(fbxPath).split(".")[0]
-        self.clipPath = fbxPath.replace("\\", "/")
-        self.agentPath = os.path.dirname(self.clipPath).replace("Animations", "Characters")
-        self.agentName = os.path.basename(self.agentPath)
-        self.agentPath = self.agentPath + "/" + self.agentName + ".fbx"
-
-        self.textLabel = QtWidgets.QLabel(text)
-        self.textLabel.setAlignment(QtCore.Qt.AlignCenter)
-
-        self.gifLabel = QtWidgets.QLabel()
-        self.gifLabel.setAlignment(QtCore.Qt.AlignCenter)
-        self.gif = QtGui.QMovie(fbxPath.replace(".fbx", ".gif"))
-        self.gifLabel.setMovie (self.gif)
-        self.gif.jumpToFrame(0)
-
-        self.layout = QtWidgets.QVBoxLayout()
-        self.layout.addWidget(self.gifLabel)
-        self.layout.addWidget(self.textLabel)
-
-        self.leaveEvent = self.stopGif
-        self.enterEvent = self.startGif
-        self.mouseDoubleClickEvent = self.import_agent
-
-        self.setAutoFillBackground(True)
-        self.setAttribute(QtCore.Qt.WA_StyledBackground, True)
-
-        style = "QWidget {"
-        style += "color: #cccccc;"
-        style += "background-color: #4b4b4b;"
-        style += "border-radius: 5px;"
-        style += "}"
-    
-        style += "QWidget:hover {"
-        style += "color: white;"
-        style += "background-color: #616161;"
-        style += "border-radius: 5px;"
-        style += "}"
+def import_agent(clip):
+    """Create a Geometry node called 'agentSetup' to store Agent nodes."""
+    # /obj context.
+    obj = hou.node("/obj/")
+    agentName = clip["agent_name"]
+
+    # Get the "agentSetup" node.
+    # We'll use this to check if we should create it or update the existing one.
+    geo_node_name = "agentSetup"
+    agent_setup_node = hou.node(f"{obj.path()}/{geo_node_name}")
+
+    # If "agentSetup" doesn't exist, create it.
+    if not agent_setup_node:
+        agent_setup_node = obj.createNode('geo', geo_node_name)
         
-        style += "QLabel:hover {"
-        style += "color: white;"
-        style += "background-color: #616161;"
-        style += "border-radius: 5px;"
-        style += "}"
-
-        self.setStyleSheet(style)
-        self.setLayout(self.layout)
-        self.setMaximumWidth(width)
-        self.setMaximumHeight(int(width*1.33))
-
-    def stopGif(self, e):
-        self.gif.stop()
-        self.gif.jumpToFrame(0)
-
-    def startGif(self, e):
-        self.gif.start()
-
-    def import_agent(self, i):
-        """Create a Geometry node called 'agentSetup' to store Agent nodes."""
-        # /obj context.
-        obj = hou.node("/obj/")
-
-        # Get the "agentSetup" node.
-        # We'll use this to check if we should create it or update the existing one.
-        geo_node_name = "agentSetup"
-        agent_setup_node = hou.node(f"{obj.path()}/{geo_node_name}")
-    
-        # If "agentSetup" doesn't exist, create it.
-        if not agent_setup_node:
-            agent_setup_node = obj.createNode('geo', geo_node_name)
-            
-        # Get the Agent node.
-        # We'll use this to check if we should create it or update the existing one.
-        agent_node = hou.node(f"{agent_setup_node.path()}/{self.agentName}")
-
-        # If the Agent node doesn't exist, create it.
-        if not agent_node:
-            agent_node = agent_setup_node.createNode("agent", self.agentName)
-
-            # Set the Agent Name.
-            agent_node.parm("agentname").set("$OS")
-
-            # Set the Input as FBX and the corresponding file path.
-            agent_node.parm("input").set(2)
-            agent_node.parm("fbxfile").set(self.agentPath)
-
-        # Get Agent Clip node, if it does not exist, create an Agent Clip node and connect it to the Agent node.
-        agent_clip_node = hou.node(f"{agent_setup_node.path()}/{self.agentName}_clips")
-        if not agent_clip_node:
-            agent_clip_node = agent_setup_node.createNode("agentclip::2.0", f"{self.agentName}_clips")
-            agent_clip_node.setInput(0, agent_node)
-            agent_clip_node.parm("source1").set(1)
-            agent_clip_node.parm("file1").set(self.clipPath)
-            agent_clip_node.parm("name1").set(self.clipName)
+    # Get the Agent node.
+    # We'll use this to check if we should create it or update the existing one.
+    agent_node = hou.node(f"{agent_setup_node.path()}/{agentName}")
+
+    # If the Agent node doesn't exist, create it.
+    if not agent_node:
+        agent_node = agent_setup_node.createNode("agent", agentName)
+
+        # Set the Agent Name.
+        agent_node.parm("agentname").set("$OS")
+
+        # Set the Input as FBX and the corresponding file path.
+        agent_node.parm("input").set(2)
+        agent_node.parm("fbxfile").set(clip["agent_path"])
+
+    # Get Agent Clip node, if it does not exist, create an Agent Clip node and connect it to the Agent node.
+    agent_clip_node = hou.node(f"{agent_setup_node.path()}/{agentName}_clips")
+    if not agent_clip_node:
+        agent_clip_node = agent_setup_node.createNode("agentclip::2.0", f"{agentName}_clips")
+        agent_clip_node.setInput(0, agent_node)
+        agent_clip_node.parm("source1").set(1)
+        agent_clip_node.parm("file1").set(clip["clip_path"])
+        agent_clip_node.parm("name1").set(clip["clip_name"])
+    else:
+        nClips = agent_clip_node.parm("clips").eval()
+        agent_clip_node.parm("clips").set(nClips+1)
+        agent_clip_node.parm(f"source{nClips+1}").set(1)
+        agent_clip_node.parm(f"file{nClips+1}").set(clip["clip_path"])
+        agent_clip_node.parm(f"name{nClips+1}").set(clip["clip_name"])
+
+    # Create an Agent Layer node, connect it to the Agent Clip node,
+    # and activate the Source Layer checkbox so we can see the character.
+    agent_layer_node = hou.node(f"{agent_setup_node.path()}/{agentName}_layer")
+    if not agent_layer_node:
+        agent_layer_node = agent_setup_node.createNode("agentlayer", f"{agentName}_layer")
+        agent_layer_node.setInput(0, agent_clip_node)
+        agent_layer_node.parm("copysourcelayer1").set(1)
+
+    # Create an Agent Prep node and connect it to the Agent Layer node.
+    agent_prep_node = hou.node(f"{agent_setup_node.path()}/{agentName}_prep")
+    if not agent_prep_node:
+        agent_prep_node = agent_setup_node.createNode("agentprep", f"{agentName}_prep")
+        agent_prep_node.setInput(0, agent_layer_node)
+
+    # Create an OUT (Null) node and connect it to the Agent Prep node.
+    out_node = hou.node(f"{agent_setup_node.path()}/OUT_{agentName}")
+    if not out_node:
+        out_node = agent_setup_node.createNode("null", f"OUT_{agentName}")
+        out_node.setInput(0, agent_prep_node)
+
+        # Activate the Display/Render flags and set the color to black.
+        out_node.setDisplayFlag(True)
+        out_node.setRenderFlag(True)
+        out_node.setColor(hou.Color((0, 0, 0)))
+
+    # Layout nodes inside "agentSetup".
+    agent_setup_node.layoutChildren()
+
+class ClipModel(QtCore.QAbstractListModel):
+    """List of the clips shown in the browser, one dictionary from the catalog per row."""
+
+    ClipRole = QtCore.Qt.UserRole + 1
+
+    def __init__(self, parent=None):
+        super(ClipModel, self).__init__(parent)
+        self.clips = []
+        self.rows = {}
+
+    def setClips(self, clips):
+        self.beginResetModel()
+        self.clips = clips
+        self.rows = {clip["clip_path"]: row for row, clip in enumerate(clips)}
+        self.endResetModel()
+
+    def clipChanged(self, clip_path):
+        """Repaint the cell of a clip, if it is in the list."""
+        row = self.rows.get(clip_path)
+        if row is not None:
+            index = self.index(row)
+            self.dataChanged.emit(index, index)
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.clips)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        clip = self.clips[index.row()]
+        if role == QtCore.Qt.DisplayRole:
+            return clip["clip_name"]
+        if role == QtCore.Qt.ToolTipRole:
+            if clip.get("thumbnail_error"):
+                return "{0}\nThumbnail failed: {1}".format(clip["clip_path"], clip["thumbnail_error"])
+            return clip["clip_path"]
+        if role == ClipModel.ClipRole:
+            return clip
+        return None
+
+class PlayerPool(QtCore.QObject):
+    """A few preview players shared by the hovered cells of a view."""
+
+    def __init__(self, view, size=3):
+        super(PlayerPool, self).__init__(view)
+        self.view = view
+        # Thumbnail path -> player, the least recently used first.
+        self.playing = OrderedDict()
+        self.indexes = {}
+        self.idle = []
+        for i in range(size):
+            player = PreviewPlayer(self)
+            player.frameChanged.connect(lambda player=player: self.repaint(player))
+            self.idle.append(player)
+
+    def play(self, index):
+        """Start playing the thumbnail of a cell, reusing the oldest player if they are all taken."""
+        clip = index.data(ClipModel.ClipRole)
+        path = clip["thumbnail_path"]
+        if not path:
+            return
+        if path in self.playing:
+            player = self.playing.pop(path)
+        elif self.idle:
+            player = self.idle.pop()
+        else:
+            old_path, player = self.playing.popitem(last=False)
+            player.stop()
+        self.playing[path] = player
+        self.indexes[player] = QtCore.QPersistentModelIndex(index)
+        player.play(path, clip["thumbnail_mtime"])
+
+    def stop(self, index):
+        player = self.playing.get(index.data(ClipModel.ClipRole)["thumbnail_path"])
+        if player:
+            player.stop()
+
+    def stopAll(self):
+        for player in self.playing.values():
+            player.stop()
+            self.idle.append(player)
+        self.playing.clear()
+        self.indexes.clear()
+
+    def image(self, clip):
+        """Current frame of the clip if one of the players has it running, otherwise None."""
+        player = self.playing.get(clip["thumbnail_path"])
+        if player and player.isPlaying():
+            return player.image()
+        return None
+
+    def repaint(self, player):
+        index = self.indexes.get(player)
+        if index is not None and index.isValid():
+            self.view.viewport().update(self.view.visualRect(QtCore.QModelIndex(index)))
+
+class ClipDelegate(QtWidgets.QStyledItemDelegate):
+    """Paints a clip cell: its thumbnail (animated while hovered) and its name."""
+
+    def __init__(self, pool, width=200, parent=None):
+        super(ClipDelegate, self).__init__(parent)
+        self.pool = pool
+        self.width = width
+
+    def still(self, clip):
+        """First frame of the thumbnail, from the shared preview cache."""
+        if not clip["thumbnail_path"]:
+            return None
+        return previewCache.first(clip["thumbnail_path"], clip["thumbnail_mtime"])
+
+    def sizeHint(self, option, index):
+        return QtCore.QSize(self.width, self.width + 30)
+
+    def paint(self, painter, option, index):
+        clip = index.data(ClipModel.ClipRole)
+        hovered = bool(option.state & QtWidgets.QStyle.State_MouseOver)
+        rect = option.rect.adjusted(3, 3, -3, -3)
+
+        painter.save()
+        painter.setRenderHint(QtGui.QPainter.Antialiasing)
+        painter.setPen(QtCore.Qt.NoPen)
+        painter.setBrush(QtGui.QColor("#616161" if hovered else "#4b4b4b"))
+        painter.drawRoundedRect(rect, 5, 5)
+
+        # Draw the thumbnail centered in the square above the name,
+        # or a placeholder while it is being generated.
+        image = self.pool.image(clip) or self.still(clip)
+        square = QtCore.QRect(rect.x(), rect.y(), rect.width(), rect.width())
+        if not image or image.isNull():
+            painter.setPen(QtGui.QColor("#888888"))
+            painter.drawText(square, QtCore.Qt.AlignCenter, "No preview yet")
         else:
-            nClips = agent_clip_node.parm("clips").eval()
-            agent_clip_node.parm("clips").set(nClips+1)
-            agent_clip_node.parm(f"source{nClips+1}").set(1)
-            agent_clip_node.parm(f"file{nClips+1}").set(self.clipPath)
-            agent_clip_node.parm(f"name{nClips+1}").set(self.clipName)
-
-        # Create an Agent Layer node, connect it to the Agent Clip node,
-        # and activate the Source Layer checkbox so we can see the character.
-        agent_layer_node = hou.node(f"{agent_setup_node.path()}/{self.agentName}_layer")
-        if not agent_layer_node:
-            agent_layer_node = agent_setup_node.createNode("agentlayer", f"{self.agentName}_layer")
-            agent_layer_node.setInput(0, agent_clip_node)
-            agent_layer_node.parm("copysourcelayer1").set(1)
-
-        # Create an Agent Prep node and connect it to the Agent Layer node.
-        agent_prep_node = hou.node(f"{agent_setup_node.path()}/{self.agentName}_prep")
-        if not agent_prep_node:
-            agent_prep_node = agent_setup_node.createNode("agentprep", f"{self.agentName}_prep")
-            agent_prep_node.setInput(0, agent_layer_node)
-
-        # Create an OUT (Null) node and connect it to the Agent Prep node.
-        out_node = hou.node(f"{agent_setup_node.path()}/OUT_{self.agentName}")
-        if not out_node:
-            out_node = agent_setup_node.createNode("null", f"OUT_{self.agentName}")
-            out_node.setInput(0, agent_prep_node)
-
-            # Activate the Display/Render flags and set the color to black.
-            out_node.setDisplayFlag(True)
-            out_node.setRenderFlag(True)
-            out_node.setColor(hou.Color((0, 0, 0)))
-
-        # Layout nodes inside "agentSetup".
-        agent_setup_node.layoutChildren()
+            size = image.size().scaled(square.size(), QtCore.Qt.KeepAspectRatio)
+            target = QtCore.QRect(QtCore.QPoint(0, 0), size)
+            target.moveCenter(square.center())
+            painter.setRenderHint(QtGui.QPainter.SmoothPixmapTransform)
+            painter.drawImage(target, image)
+
+        painter.setPen(QtGui.QColor("white" if hovered else "#cccccc"))
+        painter.drawText(QtCore.QRect(rect.x(), rect.y() + rect.width(), rect.width(), rect.height() - rect.width()),
+                         QtCore.Qt.AlignCenter, clip["clip_name"])
+        painter.restore()
 
 class ClipBrowser(QtWidgets.QWidget):
 
@@ -309,69 +308,163 @@ class ClipBrowser(QtWidgets.QWidget):
         self.setWindowTitle("Clip Browser")
         self.setWindowFlags(QtCore.Qt.WindowStaysOnTopHint)
         self.setMinimumSize(700, 250)       
-        self.columns = 3
         self.buttonwidth = 200
-        self.animatedButtons = []
+        self.hovered = None
+        # Search the clip names in memory instead of asking the catalog on every keystroke.
+        catalog.refresh()
+        self.searchIndex = ClipSearchIndex(catalog.clips())
+        self.clipsByPath = {clip["clip_path"]: clip for clip in self.searchIndex.clips}
         self.initUI()
         self.searchClips()
 
-    def resizeEvent(self, event):
-        print(f"WIDTH:{event.size().width()}")
-        self.columns = (event.size().width() - 75) // self.buttonwidth
-        print(f"COLS:{self.columns}")
-        self.searchClips()
-        QtWidgets.QWidget.resizeEvent(self, event)
+        # Generate the missing thumbnails once the window is up.
+        self.generator = GifGenerator(self)
+        self.generator.checked.connect(self.thumbnailsChecked)
+        self.generator.clipFinished.connect(self.thumbnailFinished)
+        self.generator.finished.connect(self.thumbnailsFinished)
+        QtCore.QTimer.singleShot(0, self.startThumbnails)
+
+    def startThumbnails(self):
+        self.finishedThumbnails = 0
+        self.generator.start()
+
+    def thumbnailsChecked(self, clips):
+        if not clips:
+            return
+        hou.ui.setStatusMessage("Generating {0} thumbnails in the background...".format(len(clips)),
+                                severity=hou.severityType.ImportantMessage)
+        self.prioritizeVisible()
+
+    def prioritizeVisible(self):
+        """Have the clips on screen, and then the ones matching the search, rendered first."""
+        if not hasattr(self, "generator"):
+            return
+        viewport = self.clipView.viewport().rect()
+        # The cells on screen follow each other, so stop at the first one past the bottom.
+        visible = []
+        first = max(self.clipView.indexAt(viewport.topLeft() + QtCore.QPoint(5, 5)).row(), 0)
+        for row in range(first, self.clipModel.rowCount()):
+            rect = self.clipView.visualRect(self.clipModel.index(row))
+            if rect.top() > viewport.bottom():
+                break
+            if rect.intersects(viewport):
+                visible.append(self.clipModel.clips[row])
+        if self.searchTextBox.text() or self.agentsCombobox.currentIndex() > 0:
+            visible = self.clipModel.clips
+        self.generator.prioritize(clip["clip_path"] for clip in visible)
+
+    def thumbnailFinished(self, clip, error):
+        """Swap the placeholder of a clip for its new thumbnail."""
+        self.finishedThumbnails += 1
+        hou.ui.setStatusMessage("Generating thumbnails... {0}/{1}".format(
+                                self.finishedThumbnails, len(self.generator.need_thumbnail)))
+        shown = self.clipsByPath.get(clip["clip_path"])
+        if error:
+            if error != "Cancelled":
+                hou.ui.setStatusMessage("Thumbnail of {0} failed: {1}".format(clip["clip_name"], error.strip().splitlines()[-1]),
+                                        severity=hou.severityType.Warning)
+                # Shown in the tooltip of the clip.
+                if shown is not None:
+                    shown["thumbnail_error"] = error.strip()
+                    self.clipModel.clipChanged(clip["clip_path"])
+            return
+        path = preview_path(clip["clip_path"])
+        if shown is not None and os.path.exists(path):
+            shown["thumbnail_path"] = path
+            shown["thumbnail_mtime"] = os.path.getmtime(path)
+            shown.pop("thumbnail_error", None)
+            self.clipModel.clipChanged(clip["clip_path"])
+
+    def thumbnailsFinished(self):
+        catalog.refresh()
+        # Report the clips that could not be rendered instead of aborting the batch.
+        failed = [clip for clip, error in self.generator.failed if error != "Cancelled"]
+        if failed:
+            hou.ui.setStatusMessage("{0} thumbnails could not be generated, hover their clips to see why.".format(len(failed)),
+                                    severity=hou.severityType.Warning)
+        else:
+            hou.ui.setStatusMessage("Thumbnails generated.")
+
+    def closeEvent(self, event):
+        self.generator.cancel()
+        QtWidgets.QWidget.closeEvent(self, event)
 
     def searchClips(self):
-        agent = "*" if self.agentsCombobox.currentText() == "All Agents" else self.agentsCombobox.currentText()
-        clip = "*" if self.searchTextBox.text() == "" else "*" + self.searchTextBox.text() + "*"
-
-        print(len(self.animatedButtons))
-        for button in reversed(self.animatedButtons):
-            self.animatedButtons.pop(-1)
-            button.deleteLater()
-        for i, fbx in enumerate(glob.glob(RootPath + "/Animations/" + agent + "/"+ clip + ".fbx")):
-            self.animatedButtons.append(AnimatedButton(os.path.splitext(os.path.basename(fbx))[0], fbx, self.buttonwidth))
-            self.mainWidgetLayout.addWidget(self.animatedButtons[i], i//self.columns, i%self.columns)
-        for button in self.animatedButtons:
-            print(button.clipName)
+        agent = None if self.agentsCombobox.currentText() == "All Agents" else self.agentsCombobox.currentText()
+        text = self.searchTextBox.text()
+
+        self.hoverClip(None)
+        self.playerPool.stopAll()
+        self.clipModel.setClips(self.searchIndex.search(text, agent))
+        self.prioritizeVisible()
+
+    def hoverClip(self, index):
+        """Play the thumbnail under the mouse and stop the one it left."""
+        if index is not None and not index.isValid():
+            index = None
+        if self.hovered is not None and self.hovered.isValid():
+            if index is not None and QtCore.QModelIndex(self.hovered) == index:
+                return
+            self.playerPool.stop(QtCore.QModelIndex(self.hovered))
+        self.hovered = QtCore.QPersistentModelIndex(index) if index is not None else None
+        if index is not None:
+            self.playerPool.play(index)
+
+    def eventFilter(self, watched, event):
+        if watched is self.clipView.viewport():
+            if event.type() == QtCore.QEvent.MouseMove:
+                self.hoverClip(self.clipView.indexAt(event.pos()))
+            elif event.type() == QtCore.QEvent.Leave:
+                self.hoverClip(None)
+        return super(ClipBrowser, self).eventFilter(watched, event)
+
+    def importClip(self, index):
+        import_agent(index.data(ClipModel.ClipRole))
 
     def initUI(self):
-        # Apply a Grid Layout to the main window.
+        # Apply a Vertical Layout to the main window.
         self.windowLayout = QtWidgets.QVBoxLayout()
         self.setLayout(self.windowLayout)
-    
-        # Create the main scroll area.
-        self.scrollMain = QtWidgets.QScrollArea()
-        self.scrollMain.setWidgetResizable(True)
-        self.scrollMain.setStyleSheet(r"QScrollBar {background: #454545;}")
-        # Add a Grid Layout to the main scroll area.
-        self.scrollMainLayout = QtWidgets.QGridLayout()
-        self.scrollMain.setLayout(self.scrollMainLayout)
-    
-        # Create the main widget where we will store everything.
-        self.mainWidget = QtWidgets.QWidget()
-    
-        # Add a Grid Layout to the main widget.
-        self.mainWidgetLayout = QtWidgets.QGridLayout()
-        self.mainWidget.setLayout(self.mainWidgetLayout)
-            
-        # Link the main widget to the main scroll area.
-        self.scrollMain.setWidget(self.mainWidget)
 
+        # Create the clip grid. The view only paints the visible cells
+        # and reflows the columns by itself when the window is resized.
+        self.clipModel = ClipModel(self)
+        self.clipView = QtWidgets.QListView()
+        self.clipView.setViewMode(QtWidgets.QListView.IconMode)
+        self.clipView.setResizeMode(QtWidgets.QListView.Adjust)
+        self.clipView.setMovement(QtWidgets.QListView.Static)
+        self.clipView.setUniformItemSizes(True)
+        self.clipView.setSpacing(3)
+        self.clipView.setMouseTracking(True)
+        self.clipView.setSelectionMode(QtWidgets.QAbstractItemView.NoSelection)
+        self.clipView.setVerticalScrollMode(QtWidgets.QAbstractItemView.ScrollPerPixel)
+        self.clipView.setStyleSheet(r"QScrollBar {background: #454545;}")
+        self.clipView.setModel(self.clipModel)
+        self.clipView.viewport().setAttribute(QtCore.Qt.WA_Hover, True)
+        self.clipView.viewport().installEventFilter(self)
+        self.clipView.doubleClicked.connect(self.importClip)
+        self.clipView.verticalScrollBar().valueChanged.connect(lambda value: self.prioritizeVisible())
+
+        self.playerPool = PlayerPool(self.clipView)
+        self.clipView.setItemDelegate(ClipDelegate(self.playerPool, self.buttonwidth, self.clipView))
 
         #==============FILTER LAYOUT=========================
         self.agentsCombobox = QtWidgets.QComboBox()
         self.agentsCombobox.addItem("All Agents")
-        for folder in os.listdir(RootPath + "/Animations/"):
-            if(len(folder.split('.')) < 2):
-                self.agentsCombobox.addItem(folder)
+        for agent in catalog.agents():
+            self.agentsCombobox.addItem(agent)
         self.agentsCombobox.currentIndexChanged.connect(self.searchClips)
         self.searchLabel = QtWidgets.QLabel("Search:")
         self.searchLabel.setAlignment(QtCore.Qt.AlignRight | QtCore.Qt.AlignVCenter)
 
+        # Wait until the user stops typing for a moment before searching.
+        self.searchTimer = QtCore.QTimer(self)
+        self.searchTimer.setSingleShot(True)
+        self.searchTimer.setInterval(150)
+        self.searchTimer.timeout.connect(self.searchClips)
+
         self.searchTextBox = QtWidgets.QLineEdit()
-        self.searchTextBox.textChanged.connect(self.searchClips)
+        self.searchTextBox.textChanged.connect(lambda text: self.searchTimer.start())
         self.searchTextBox.setStyleSheet("max-width: 240px;")
 
         self.filterLayout = QtWidgets.QHBoxLayout()
@@ -381,12 +474,9 @@ class ClipBrowser(QtWidgets.QWidget):
 
         # Add the main widgets to the window layout.
         self.windowLayout.addLayout(self.filterLayout)
-        self.windowLayout.addWidget(self.scrollMain)
-
-        # Layouts
-        self.setLayout(self.mainWidgetLayout)
+        self.windowLayout.addWidget(self.clipView)
 
-gg = GifGenerator()
+catalog = ClipCatalog(RootPath)
 
 #Run app
 app = ClipBrowser()
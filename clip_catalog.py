@@ -0,0 +1,173 @@
+"""On-disk catalog of the agent clips under RootPath/Animations.
+
+The catalog keeps every clip, its agent, skin, thumbnail, size and mtime in a
+SQLite database so the Clip Browser can query it instead of walking the
+library share. A refresh only looks at the mtime of the agent folders and
+re-reads the ones that changed, which is enough to open the browser. A deep
+refresh (done in the background by the thumbnail check) also stats the clips
+of every folder, so an .FBX overwritten in place is picked up even though its
+folder's mtime stays the same.
+"""
+import os, json, sqlite3, threading
+import thumbnail_manifest
+from thumbnail_farm import PreviewFormat, PreviewSuffixes
+
+# The database lives on the local disk, SQLite does not like network shares.
+CatalogPath = os.path.join(os.path.expanduser("~"), ".clip_catalog.db")
+
+# Bump when the tables change, the catalog is then rebuilt from scratch.
+SchemaVersion = 5
+Schema = """
+CREATE TABLE IF NOT EXISTS directories (
+    path TEXT PRIMARY KEY,
+    root TEXT NOT NULL,
+    agent_name TEXT NOT NULL,
+    agent_path TEXT NOT NULL,
+    mtime REAL NOT NULL,
+    stamp TEXT NOT NULL,
+    preview_format TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS clips (
+    clip_path TEXT PRIMARY KEY,
+    directory TEXT NOT NULL,
+    clip_name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    thumbnail_path TEXT,
+    thumbnail_mtime REAL,
+    rendered_size INTEGER,
+    rendered_mtime REAL,
+    rendered_hash TEXT
+);
+CREATE INDEX IF NOT EXISTS clips_directory ON clips (directory);
+"""
+
+
+def list_directory(path):
+    """The .FBX files and thumbnails of an agent folder, as ({name: stat}, {name: stat}, stamp).
+
+    The stamp changes whenever a clip, a thumbnail or the thumbnail manifest does.
+    """
+    agent_name = os.path.basename(path)
+    suffix = PreviewSuffixes[PreviewFormat]
+    fbx_files, thumbnails, stamp = {}, {}, []
+    for entry in os.scandir(path):
+        name, ext = os.path.splitext(entry.name)
+        # If it's the agent skin, don't add it to the catalog.
+        if name == agent_name or not entry.is_file():
+            continue
+        if ext == ".fbx":
+            stat = fbx_files[name] = entry.stat()
+        elif entry.name.endswith(suffix):
+            stat = thumbnails[entry.name[:-len(suffix)]] = entry.stat()
+        elif entry.name == thumbnail_manifest.ManifestName:
+            stat = entry.stat()
+        else:
+            continue
+        stamp.append((entry.name, stat.st_size, stat.st_mtime))
+    return fbx_files, thumbnails, json.dumps(sorted(stamp))
+
+
+class ClipCatalog():
+    """Clips, agents and thumbnails of one library root, stored in SQLite."""
+
+    def __init__(self, root_path, db_path=CatalogPath):
+        self.root_path = root_path.replace("\\", "/")
+        self.animations_path = self.root_path + "/Animations"
+        # The thumbnail check refreshes it from a background thread while the browser queries it.
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        if self.db.execute("PRAGMA user_version").fetchone()[0] != SchemaVersion:
+            self.db.executescript("DROP TABLE IF EXISTS clips; DROP TABLE IF EXISTS directories;")
+            self.db.execute("PRAGMA user_version = {0}".format(SchemaVersion))
+        self.db.executescript(Schema)
+
+    def refresh(self, deep=False):
+        """Bring the catalog up to date, rescanning only the agent folders whose mtime changed.
+
+        With DEEP, the clips of every folder are listed too, and the folders
+        whose clips or thumbnails changed are rescanned as well.
+        """
+        # Folders scanned for another preview format are treated as changed.
+        with self.lock:
+            known = dict((row[0], (row[1], row[2])) for row in self.db.execute(
+                "SELECT path, mtime, stamp FROM directories WHERE root = ? AND preview_format = ?",
+                (self.root_path, PreviewFormat)))
+        found = {}
+        if os.path.isdir(self.animations_path):
+            for entry in os.scandir(self.animations_path):
+                if entry.is_dir():
+                    found[entry.path.replace("\\", "/")] = entry.stat().st_mtime
+
+        # Rescan the new agent folders and the ones that changed since last time.
+        changed = {}
+        for path, mtime in found.items():
+            old_mtime, old_stamp = known.get(path, (None, None))
+            if mtime != old_mtime or deep:
+                listing = list_directory(path)
+                if mtime != old_mtime or listing[2] != old_stamp:
+                    changed[path] = listing
+
+        with self.lock, self.db:
+            # Forget the agent folders that were removed.
+            for path in set(known) - set(found):
+                self.db.execute("DELETE FROM clips WHERE directory = ?", (path,))
+                self.db.execute("DELETE FROM directories WHERE path = ?", (path,))
+            for path, listing in changed.items():
+                self.scan_directory(path, found[path], *listing)
+        return len(changed)
+
+    def scan_directory(self, path, mtime, fbx_files, thumbnails, stamp):
+        """Replace the clips stored for one agent folder with its listing (see list_directory)."""
+        agent_name = os.path.basename(path)
+        agent_path = path.replace("Animations", "Characters") + "/" + agent_name + ".fbx"
+        suffix = PreviewSuffixes[PreviewFormat]
+
+        # What each thumbnail was rendered from, as recorded in the sidecar manifest.
+        manifest = thumbnail_manifest.read_manifest(path)
+
+        rows = []
+        for name, stat in fbx_files.items():
+            rendered = manifest.get(name, {})
+            rows.append((path + "/" + name + ".fbx", path, name, stat.st_size, stat.st_mtime,
+                         path + "/" + name + suffix if name in thumbnails else None,
+                         thumbnails[name].st_mtime if name in thumbnails else None,
+                         rendered.get("size"), rendered.get("mtime"), rendered.get("hash")))
+
+        self.db.execute("DELETE FROM clips WHERE directory = ?", (path,))
+        self.db.executemany("INSERT INTO clips VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        self.db.execute("INSERT OR REPLACE INTO directories VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (path, self.root_path, agent_name, agent_path, mtime, stamp, PreviewFormat))
+
+    def agents(self):
+        """Return the sorted names of the agents in the library."""
+        with self.lock:
+            return [row[0] for row in self.db.execute(
+                "SELECT agent_name FROM directories WHERE root = ? ORDER BY agent_name",
+                (self.root_path,))]
+
+    def clips(self, agent_name=None, text=None, stale=False):
+        """Return the clips as dictionaries, optionally filtered by agent, name and thumbnail.
+
+        With STALE, only the clips whose thumbnail is missing or older than
+        their .FBX are returned.
+        """
+        query = ("SELECT clip_name, clip_path, agent_name, agent_path, size, clips.mtime AS mtime, thumbnail_path, "
+                 "thumbnail_mtime, rendered_size, rendered_mtime, rendered_hash "
+                 "FROM clips JOIN directories ON clips.directory = directories.path WHERE root = ?")
+        args = [self.root_path]
+        if agent_name:
+            query += " AND agent_name = ?"
+            args.append(agent_name)
+        if text:
+            query += " AND instr(lower(clip_name), lower(?)) > 0"
+            args.append(text)
+        if stale:
+            # Thumbnails rendered before the manifest existed are compared by mtime.
+            query += (" AND (thumbnail_path IS NULL"
+                      " OR (rendered_mtime IS NULL AND clips.mtime > thumbnail_mtime)"
+                      " OR (rendered_mtime IS NOT NULL AND (rendered_size != size OR rendered_mtime != clips.mtime)))")
+        query += " ORDER BY clip_path"
+        with self.lock:
+            return [dict(row) for row in self.db.execute(query, args)]
@@ -0,0 +1,76 @@
+"""In-memory search index over the clip names of the Clip Browser.
+
+The index is built once from the catalog and every query is answered from
+memory. When a query only extends the previous one (the user typed one more
+character), the previous results are filtered instead of the whole index.
+"""
+import re
+
+# How each term of the query is matched against the clip names.
+#   substring: anywhere in the name ("jump" matches "Running_Jump")
+#   prefix:    at the start of the name
+#   token:     at the start of any word of the name ("run" matches "Running_Jump")
+Modes = ("substring", "prefix", "token")
+
+_word = re.compile(r"[A-Z]?[a-z]+|[A-Z]+(?![a-z])|[0-9]+")
+
+
+def tokenize(name):
+    """Split a clip name into lowercase words: "RunningJump_02" -> ["running", "jump", "02"]."""
+    return [word.lower() for word in _word.findall(name)]
+
+
+class ClipSearchIndex():
+    """Lowercase names and words of every clip, with the results of the last query."""
+
+    def __init__(self, clips, mode="substring", fuzzy=False):
+        self.mode = mode
+        self.fuzzy = fuzzy
+        self.setClips(clips)
+
+    def setClips(self, clips):
+        self.clips = clips
+        self.names = [clip["clip_name"].lower() for clip in clips]
+        # Words are stored with a leading space so "token" is a plain substring test.
+        self.words = [" " + " ".join(tokenize(clip["clip_name"])) for clip in clips]
+        self.agents = [clip["agent_name"] for clip in clips]
+        self.last_key = None
+        self.last_query = None
+        self.last_rows = None
+
+    def match(self, term, rows):
+        """Rows of ROWS whose clip matches a single query term."""
+        if self.fuzzy:
+            # Letters in order, with anything in between: "rnjmp" matches "running_jump".
+            pattern = re.compile(".*?".join(re.escape(c) for c in term))
+            names = self.names
+            return [i for i in rows if pattern.search(names[i])]
+        if self.mode == "prefix":
+            names = self.names
+            return [i for i in rows if names[i].startswith(term)]
+        if self.mode == "token":
+            term = " " + term
+            words = self.words
+            return [i for i in rows if term in words[i]]
+        names = self.names
+        return [i for i in rows if term in names[i]]
+
+    def search(self, text, agent_name=None):
+        """Return the clips matching every word of TEXT, optionally for a single agent."""
+        query = text.lower().strip()
+        key = (agent_name, self.mode, self.fuzzy)
+
+        # Typing one more character can only remove results, so start from the last ones.
+        if key == self.last_key and self.last_query is not None and query.startswith(self.last_query):
+            rows = self.last_rows
+        elif agent_name:
+            rows = [i for i, agent in enumerate(self.agents) if agent == agent_name]
+        else:
+            rows = range(len(self.clips))
+
+        for term in query.split():
+            rows = self.match(term, rows)
+        rows = list(rows)
+
+        self.last_key, self.last_query, self.last_rows = key, query, rows
+        return [self.clips[i] for i in rows]
@@ -0,0 +1,258 @@
+"""Stand-in for the parts of the hou module used by thumbnail_farm.py.
+
+It lets the farm run outside Houdini: nodes only store their parameters, the
+Agent Clip geometry is made up and the OpenGL render writes placeholder JPEGs,
+so the worker protocol, the failure path and cancelling can be tried with a
+plain Python interpreter. Set THUMBNAIL_FAKE_HOU before starting the farm and
+use Python itself as the worker executable:
+    os.environ["THUMBNAIL_FAKE_HOU"] = "1"
+    thumbnail_farm.ThumbnailFarm(hython=sys.executable).run(clips)
+
+Clip files may hold a JSON dictionary to change how they render:
+    {"length": 2.5}     clip length in seconds (default ClipLength)
+    {"fail": "reason"}  the render raises with this message
+    {"crash": true}     the worker process exits in the middle of the render
+Missing agent or clip files fail the same way Houdini would.
+"""
+import os, json, time
+
+# Frame rate used to turn clip times into frames.
+Fps = 24.0
+# Length, in seconds, of clips that don't set one.
+ClipLength = 1.0
+# Seconds spent rendering each frame, to leave time to cancel a batch.
+# Set it for the workers with the FAKE_HOU_FRAME_DELAY environment variable.
+FrameDelay = float(os.environ.get("FAKE_HOU_FRAME_DELAY", "0"))
+# Smallest valid JPEG (a single white pixel) written for every frame.
+Jpeg = bytes.fromhex(
+    "ffd8ffe000104a46494600010100000100010000ffdb004300080606070605080707"
+    "070909080a0c140d0c0b0b0c1912130f141d1a1f1e1d1a1c1c20242e2720222c231c"
+    "1c2837292c30313434341f27393d38323c2e333432ffc0000b080001000101011100"
+    "ffc4001f0000010501010101010100000000000000000102030405060708090a0bff"
+    "c400b5100002010303020403050504040000017d0102030004110512213141061351"
+    "6107227114328191a1082342b1c11552d1f02433627282090a161718191a25262728"
+    "292a3435363738393a434445464748494a535455565758595a636465666768696a73"
+    "7475767778797a838485868788898a92939495969798999aa2a3a4a5a6a7a8a9aab2"
+    "b3b4b5b6b7b8b9bac2c3c4c5c6c7c8c9cad2d3d4d5d6d7d8d9dae1e2e3e4e5e6e7e8"
+    "e9eaf1f2f3f4f5f6f7f8f9faffda0008010100003f00f7faffd9")
+
+
+class OperationFailed(Exception):
+    pass
+
+
+class nodeFlag():
+    Display = "display"
+    Render = "render"
+
+
+class Parm():
+    def __init__(self, value=None):
+        self.value = value
+
+    def set(self, value):
+        self.value = value
+
+    def eval(self):
+        return self.value
+
+
+class BoundingBox():
+    def __init__(self, minvec, maxvec):
+        self._minvec = minvec
+        self._maxvec = maxvec
+
+    def minvec(self):
+        return self._minvec
+
+    def maxvec(self):
+        return self._maxvec
+
+    def sizevec(self):
+        return tuple(b - a for a, b in zip(self._minvec, self._maxvec))
+
+    def center(self):
+        return tuple((a + b) / 2.0 for a, b in zip(self._minvec, self._maxvec))
+
+
+class AgentClip():
+    def __init__(self, length):
+        self._length = length
+
+    def length(self):
+        return self._length
+
+
+class AgentPrim():
+    def __init__(self, length):
+        self.clip = AgentClip(length)
+
+    def clipTimes(self):
+        return (0.0,)
+
+    def clips(self):
+        return (self.clip,)
+
+
+class Geometry():
+    def __init__(self, length):
+        self.prim = AgentPrim(length)
+
+    def boundingBox(self):
+        # Roughly the size of a standing character, in meters.
+        return BoundingBox((-0.5, 0.0, -0.3), (0.5, 1.8, 0.3))
+
+    def prims(self):
+        return (self.prim,)
+
+
+class Node():
+    def __init__(self, parent, type_name, name):
+        self.parent = parent
+        self.type_name = type_name
+        self._name = name
+        self.parms = {}
+        self.children = {}
+        self.inputs = []
+        self.flags = {}
+
+    def path(self):
+        if self.parent is None:
+            return "/" + self._name if self._name else "/"
+        return self.parent.path().rstrip("/") + "/" + self._name
+
+    def name(self):
+        return self._name
+
+    def type(self):
+        return self.type_name
+
+    def createNode(self, type_name, name=None):
+        base = name or type_name.split("::")[0]
+        name, count = base, 1
+        while name in self.children:
+            count += 1
+            name = "{0}{1}".format(base, count)
+        node = Node(self, type_name, name)
+        self.children[name] = node
+        return node
+
+    def node(self, path):
+        node = self
+        for name in path.strip("/").split("/"):
+            if name:
+                node = node.children.get(name)
+                if node is None:
+                    return None
+        return node
+
+    def destroy(self):
+        if self.parent is not None:
+            self.parent.children.pop(self._name, None)
+            self.parent = None
+
+    def parm(self, name):
+        return self.parms.setdefault(name, Parm())
+
+    def parmTuple(self, name):
+        return self.parms.setdefault(name, Parm())
+
+    def evalParm(self, name):
+        return self.parm(name).eval()
+
+    def setFirstInput(self, node):
+        self.inputs[:1] = [node]
+
+    def setGenericFlag(self, flag, value):
+        self.flags[flag] = value
+
+    def geometry(self):
+        """Cook an Agent Clip node: the agent and the clip file must exist."""
+        if not self.type_name.startswith("agentclip"):
+            return Geometry(0.0)
+        agent_path = self.inputs[0].evalParm("fbxfile") if self.inputs else None
+        if not agent_path or not os.path.isfile(agent_path):
+            raise OperationFailed("Unable to load agent from {0}".format(agent_path))
+        options = read_options(self.evalParm("file1"))
+        return Geometry(options.get("length", ClipLength))
+
+    def render(self):
+        """Render an OpenGL ROP: one placeholder JPEG per frame of the "f" range."""
+        if self.type_name != "opengl":
+            raise OperationFailed("{0} is not a render node".format(self.path()))
+        geo = root.node("/obj/" + (self.evalParm("vobjects") or ""))
+        clip_node = next((node for node in geo.children.values() if node.flags.get(nodeFlag.Render)), None) if geo else None
+        if clip_node is None:
+            raise OperationFailed("Nothing to render")
+        # Cook first, like the viewport would.
+        clip_node.geometry()
+        options = read_options(clip_node.evalParm("file1"))
+        if options.get("fail"):
+            raise OperationFailed(options["fail"])
+
+        start, end, step = self.evalParm("f")
+        picture = self.evalParm("picture")
+        frame = start
+        while frame <= end:
+            if options.get("crash"):
+                os._exit(1)
+            setFrame(frame)
+            with open(expand_string(picture), "wb") as f:
+                f.write(Jpeg)
+            time.sleep(FrameDelay)
+            frame += step
+
+
+def read_options(clip_path):
+    """Return the options stored in a clip file, or fail if it doesn't exist."""
+    if not clip_path or not os.path.isfile(clip_path):
+        raise OperationFailed("Unable to load clip from {0}".format(clip_path))
+    try:
+        with open(clip_path) as f:
+            options = json.load(f)
+    except ValueError:
+        return {}
+    return options if isinstance(options, dict) else {}
+
+
+def padzero(width, value):
+    return str(int(value)).zfill(width)
+
+
+def expand_string(text):
+    """Expand $F and the `backtick` expressions of a parameter value at the current frame."""
+    parts = text.replace("$F", str(int(current_frame))).split("`")
+    for i in range(1, len(parts), 2):
+        parts[i] = str(eval(parts[i], {"__builtins__": {}}, {"padzero": padzero, "round": round}))
+    return "".join(parts)
+
+
+def node(path):
+    return root.node(path)
+
+
+def setFrame(frame):
+    global current_frame
+    current_frame = frame
+
+
+def frame():
+    return current_frame
+
+
+def fps():
+    return Fps
+
+
+def timeToFrame(time):
+    return time * Fps + 1
+
+
+def frameToTime(frame):
+    return (frame - 1) / Fps
+
+
+root = Node(None, "root", "")
+for name in ("obj", "out"):
+    root.children[name] = Node(root, name, name)
+current_frame = 1
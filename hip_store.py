@@ -0,0 +1,221 @@
+"""Deduplicated storage for the versioned .hip files of a shot folder.
+
+Instead of a full copy per version, a version is cut into chunks that are
+stored once, by content, in a .hipstore folder next to the versions:
+
+    .hipstore/chunks/ab/ab12...   zlib compressed chunk, named after its hash
+    .hipstore/manifests/shot_v004.hip.json   size and list of chunks of a version
+
+Consecutive versions usually differ by a few parameters, so most of their
+chunks are already in the store. Chunk boundaries are picked from the content
+(at the end of lines whose checksum matches a mask), so an edit only changes
+the chunks around it instead of shifting every chunk after it.
+
+Benchmark a folder of plain versions against the store:
+    python hip_store.py benchmark C:/Path/To/Shot
+"""
+import os, sys, json, time, zlib, hashlib, shutil, tempfile
+
+StoreDir = ".hipstore"
+# Chunks are cut after a line whose crc32 matches this mask (about every
+# 2048 lines), once they are at least MinChunk long. Lines are never longer
+# than MaxChunk, so binary data gets cut too.
+BoundaryMask = 0x7FF
+MinChunk = 16 * 1024
+MaxChunk = 1024 * 1024
+# Chunks younger than this are never collected: a save may still be writing
+# the chunks of a version whose manifest isn't there yet.
+CollectGrace = 3600
+
+
+def store_path(directory):
+    return os.path.join(directory, StoreDir)
+
+
+def manifest_path(directory, filename):
+    return os.path.join(store_path(directory), "manifests", os.path.basename(filename) + ".json")
+
+
+def chunk_path(directory, digest):
+    return os.path.join(store_path(directory), "chunks", digest[:2], digest)
+
+
+def chunks(f):
+    """Yield the content-defined chunks of an open binary file."""
+    chunk = []
+    size = 0
+    while True:
+        line = f.readline(MaxChunk)
+        if not line:
+            break
+        chunk.append(line)
+        size += len(line)
+        if size >= MaxChunk or (size >= MinChunk and zlib.crc32(line) & BoundaryMask == 0):
+            yield b"".join(chunk)
+            chunk, size = [], 0
+    if chunk:
+        yield b"".join(chunk)
+
+
+def _temp_file(path):
+    """(file, name) of a new temp file next to PATH, never shared with another save."""
+    if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    handle, temp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp_")
+    return os.fdopen(handle, "wb"), temp
+
+
+def _write_atomic(path, data):
+    f, temp = _temp_file(path)
+    try:
+        with f:
+            f.write(data)
+        os.replace(temp, path)
+    except BaseException:
+        os.remove(temp)
+        raise
+
+
+def store(path, directory, filename=None, progress=None):
+    """Store the file at PATH as version FILENAME of DIRECTORY. Returns the bytes written to the store.
+
+    PROGRESS, if given, is called with the percentage of the file stored so far.
+    """
+    filename = os.path.basename(filename or path)
+    total = max(os.path.getsize(path), 1)
+    done = 0
+    digests = []
+    written = 0
+    file_hash = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        for chunk in chunks(f):
+            done += len(chunk)
+            if progress:
+                progress(int(done * 100 / total))
+            file_hash.update(chunk)
+            digest = hashlib.blake2b(chunk, digest_size=20).hexdigest()
+            digests.append(digest)
+            # Only new content is written, the rest is already in the store.
+            target = chunk_path(directory, digest)
+            try:
+                # Touched so collect_garbage() sees it as young until the manifest is written.
+                os.utime(target)
+            except FileNotFoundError:
+                data = zlib.compress(chunk, 1)
+                _write_atomic(target, data)
+                written += len(data)
+
+    manifest = json.dumps({"size": os.path.getsize(path), "hash": file_hash.hexdigest(),
+                           "chunks": digests}).encode("utf-8")
+    # The manifest goes last, so a version is only listed once all its chunks are there.
+    _write_atomic(manifest_path(directory, filename), manifest)
+    return written + len(manifest)
+
+
+def has_version(directory, filename):
+    return os.path.exists(manifest_path(directory, filename))
+
+
+def versions(directory):
+    """File names of the versions in the store of DIRECTORY."""
+    manifests = os.path.join(store_path(directory), "manifests")
+    if not os.path.isdir(manifests):
+        return []
+    return [f[:-len(".json")] for f in os.listdir(manifests) if f.endswith(".json")]
+
+
+def restore(directory, filename, destination):
+    """Rebuild version FILENAME of DIRECTORY at DESTINATION. Returns DESTINATION."""
+    with open(manifest_path(directory, filename), "r") as f:
+        manifest = json.load(f)
+
+    file_hash = hashlib.blake2b(digest_size=20)
+    out, temp = _temp_file(destination)
+    try:
+        with out:
+            for digest in manifest["chunks"]:
+                with open(chunk_path(directory, digest), "rb") as f:
+                    chunk = zlib.decompress(f.read())
+                file_hash.update(chunk)
+                out.write(chunk)
+        if file_hash.hexdigest() != manifest["hash"]:
+            raise IOError("{0} is corrupted in the store of {1}".format(filename, directory))
+        os.replace(temp, destination)
+    except BaseException:
+        os.remove(temp)
+        raise
+    return destination
+
+
+def remove_version(directory, filename):
+    """Forget version FILENAME. Its chunks stay until collect_garbage()."""
+    os.remove(manifest_path(directory, filename))
+
+
+def collect_garbage(directory):
+    """Delete the chunks no version uses anymore. Returns the bytes freed."""
+    used = set()
+    for filename in versions(directory):
+        with open(manifest_path(directory, filename), "r") as f:
+            used.update(json.load(f)["chunks"])
+
+    freed = 0
+    cutoff = time.time() - CollectGrace
+    for root, dirs, files in os.walk(os.path.join(store_path(directory), "chunks")):
+        for digest in files:
+            path = os.path.join(root, digest)
+            if digest not in used and os.path.getmtime(path) < cutoff:
+                freed += os.path.getsize(path)
+                os.remove(path)
+    return freed
+
+
+def disk_usage(path):
+    total = 0
+    for root, dirs, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+    return total
+
+
+def benchmark(directory):
+    """Compare disk usage and load time of the .hip files of DIRECTORY stored as plain copies and deduplicated."""
+    hips = sorted(f for f in os.listdir(directory) if f.endswith(".hip"))
+    if not hips:
+        print("No .hip files in {0}".format(directory))
+        return
+
+    scratch = tempfile.mkdtemp(prefix="hipstore_benchmark_")
+    try:
+        start = time.time()
+        for hip in hips:
+            store(os.path.join(directory, hip), scratch)
+        store_time = time.time() - start
+
+        start = time.time()
+        for hip in hips:
+            with open(os.path.join(directory, hip), "rb") as f:
+                while f.read(MaxChunk):
+                    pass
+        plain_load = time.time() - start
+
+        start = time.time()
+        for hip in hips:
+            restore(scratch, hip, os.path.join(scratch, "restored", hip))
+        store_load = time.time() - start
+
+        plain_size = sum(os.path.getsize(os.path.join(directory, hip)) for hip in hips)
+        store_size = disk_usage(store_path(scratch))
+        print("{0} versions".format(len(hips)))
+        print("Disk usage:  plain {0:.1f} MB   store {1:.1f} MB   ({2:.0%})".format(
+            plain_size / 1e6, store_size / 1e6, store_size / float(max(plain_size, 1))))
+        print("Load time:   plain {0:.3f} s    store {1:.3f} s".format(plain_load, store_load))
+        print("Store time:  {0:.3f} s".format(store_time))
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == "benchmark":
+        benchmark(sys.argv[2])
+    else:
+        print("Usage:\n\tpython hip_store.py benchmark C:/Path/To/Shot")
@@ -0,0 +1,196 @@
+"""Append-only key/value store kept next to the versioned files, used for comments.
+
+A store called "comments" is made of:
+    comments.json     the snapshot, a plain {key: value} JSON file. This is the
+                      file older versions of the Save dialog wrote, so existing
+                      comments are read as they are.
+    comments.journal  one JSON line per change since the last compaction.
+    comments.lock     locked while writing, so artists saving into the same
+                      folder at the same time don't lose each other's changes.
+
+Saving appends a single line to the journal instead of rewriting the whole
+file. Once the journal grows past CompactSize it is folded into the snapshot.
+Reads are cached and only the new journal lines are read when it grows.
+"""
+import os, json, time, logging
+
+# Journal size, in bytes, above which it is folded into the snapshot.
+CompactSize = 64 * 1024
+
+if os.name == "nt":
+    import msvcrt
+
+    def _lock(f):
+        # LK_NBLCK fails right away if someone else holds the lock, so keep trying.
+        while True:
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+                return
+            except OSError:
+                time.sleep(0.05)
+
+    def _unlock(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    def _lock(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+    def _unlock(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+log = logging.getLogger(__name__)
+
+# (directory, name) -> JournalStore, shared by every dialog of the session.
+_stores = {}
+
+
+class JournalStore():
+    """Key/value store of one directory, backed by a JSON snapshot and an append-only journal."""
+
+    def __init__(self, directory, name):
+        self.directory = directory
+        self.snapshot_path = os.path.join(directory, name + ".json")
+        self.journal_path = os.path.join(directory, name + ".journal")
+        self.lock_path = os.path.join(directory, name + ".lock")
+        self.values = {}
+        self.snapshot_key = None
+        self.journal_key = None
+        self.journal_offset = 0
+
+    def lock(self):
+        """Open and lock the lock file. Unlock it with unlock()."""
+        f = open(self.lock_path, "a+")
+        f.seek(0)
+        _lock(f)
+        return f
+
+    def unlock(self, f):
+        _unlock(f)
+        f.close()
+
+    def read_snapshot(self, strict=False):
+        """Return the values of the snapshot. A broken snapshot reads as empty, or raises ValueError if STRICT."""
+        try:
+            with open(self.snapshot_path, "r") as f:
+                values = json.load(f)
+            if not isinstance(values, dict):
+                raise ValueError("{0} is not a dictionary".format(self.snapshot_path))
+            return values
+        except OSError:
+            return {}
+        except ValueError:
+            if strict:
+                raise
+            return {}
+
+    def read_journal(self, values, offset=0):
+        """Apply the journal lines after OFFSET to VALUES. Returns the offset it stopped at."""
+        try:
+            f = open(self.journal_path, "rb")
+        except OSError:
+            return 0
+        with f:
+            f.seek(offset)
+            for line in f:
+                # A line still being written has no newline yet, leave it for next time.
+                if not line.endswith(b"\n"):
+                    break
+                offset += len(line)
+                try:
+                    change = json.loads(line.decode("utf-8"))
+                except ValueError:
+                    continue
+                if change.get("value") is None:
+                    values.pop(change["key"], None)
+                else:
+                    values[change["key"]] = change["value"]
+        return offset
+
+    def all(self):
+        """Return every key and value, reading only what changed since the last call."""
+        snapshot_key = _file_key(self.snapshot_path)
+        journal_key = _file_key(self.journal_path)
+        if snapshot_key == self.snapshot_key and journal_key == self.journal_key:
+            return self.values
+
+        if snapshot_key != self.snapshot_key or journal_key is None or journal_key[1] < self.journal_offset:
+            # The snapshot changed or the journal was compacted: read everything.
+            self.values = self.read_snapshot()
+            self.journal_offset = 0
+        self.journal_offset = self.read_journal(self.values, self.journal_offset)
+        self.snapshot_key, self.journal_key = snapshot_key, journal_key
+        return self.values
+
+    def get(self, key, default=None):
+        return self.all().get(key, default)
+
+    def set(self, key, value):
+        """Record a value (None removes the key) with a single append to the journal."""
+        line = (json.dumps({"key": key, "value": value}) + "\n").encode("utf-8")
+        lock = self.lock()
+        try:
+            with open(self.journal_path, "ab") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+                size = f.tell()
+            if size > CompactSize:
+                try:
+                    self._compact()
+                except OSError as e:
+                    # The line is already in the journal, compacting can wait for the next change.
+                    log.warning("Could not compact %s: %s", self.journal_path, e)
+        finally:
+            self.unlock(lock)
+
+    def compact(self):
+        """Fold the journal into the snapshot."""
+        lock = self.lock()
+        try:
+            self._compact()
+        finally:
+            self.unlock(lock)
+
+    def _compact(self):
+        # Must be called with the lock held.
+        try:
+            values = self.read_snapshot(strict=True)
+        except ValueError:
+            # Never overwrite a snapshot we can't read, the journal keeps the changes.
+            return
+        self.read_journal(values)
+        try:
+            with open(self.snapshot_path + ".tmp", "w") as f:
+                f.write(json.dumps(values, indent=4))
+            # Fails on Windows while someone else has the snapshot open.
+            os.replace(self.snapshot_path + ".tmp", self.snapshot_path)
+        except OSError:
+            if os.path.exists(self.snapshot_path + ".tmp"):
+                os.remove(self.snapshot_path + ".tmp")
+            raise
+        # If we die before this, replaying the journal again gives the same values.
+        open(self.journal_path, "w").close()
+
+
+def _file_key(path):
+    try:
+        stat = os.stat(path)
+        return (stat.st_mtime, stat.st_size)
+    except OSError:
+        return None
+
+
+def get_store(directory, name):
+    """Return the JournalStore called NAME in DIRECTORY, the same object on every call."""
+    key = (os.path.normcase(os.path.abspath(directory)), name)
+    if key not in _stores:
+        _stores[key] = JournalStore(directory, name)
+    return _stores[key]
+
+
+def comment_store(directory):
+    """The store of the version comments of a directory (comments.json)."""
+    return get_store(directory, "comments")
@@ -1,29 +1,92 @@
 from PySide2 import QtWidgets, QtCore, QtGui
-import os, glob
+import os, tempfile
 import hou
-import json
+import hip_store
+from version_index import get_index
+from journal_store import comment_store
+import version_metadata
+import load_modes
+from version_watcher import get_watcher, normalize
+
+#Versions kept in the deduplicated store are rebuilt here before loading
+LocalLoadDir = os.path.join(tempfile.gettempdir(), "houdini_loads")
+
+class ProjectCrawl(QtCore.QThread):
+    """Brings the project index up to date on a background thread."""
+
+    def __init__(self, projectIndex, parent=None):
+        super(ProjectCrawl, self).__init__(parent)
+        self.projectIndex = projectIndex
+
+    def run(self):
+        self.projectIndex.refresh()
 
 class LoadFileApp(QtWidgets.QWidget):
     def __init__(self):
         super(LoadFileApp, self).__init__()
-        self.filePaths = []
+        self.index = None
+        self.watchedDirectory = None
+        self.projectIndex = None
+        self.projectCrawl = None
         self.initUI()
-        self.listFiles()
+        get_watcher().changed.connect(self.versionsChanged)
+        #List the files once the window is up, not before it shows
+        QtCore.QTimer.singleShot(0, self.listFiles)
+
+    def reset(self):
+        """Get ready to be shown again, for the scene open now."""
+        path = self.currentPath()
+        if(path != self.filePathTextBox.text()):
+            self.filePathTextBox.setText(path)
+        else:
+            QtCore.QTimer.singleShot(0, self.listFiles)
+
+    def currentPath(self):
+        return hou.homeHoudiniDirectory() if hou.hipFile.isNewFile() else os.path.dirname(hou.hipFile.path())
 
     def initUI(self):
         #======================FILEPATH=====================
         self.filePathLabel = QtWidgets.QLabel("File Path:   ")
 
-        self.filePathTextBox = QtWidgets.QLineEdit(hou.homeHoudiniDirectory() if hou.hipFile.isNewFile() else os.path.dirname(hou.hipFile.path()))
+        self.filePathTextBox = QtWidgets.QLineEdit(self.currentPath())
         self.filePathTextBox.textChanged.connect(self.listFiles)
 
         self.buttonBrowse = QtWidgets.QPushButton("Browse")
         self.buttonBrowse.clicked.connect(self.openFolderDialog)
+
+        self.buttonCleanUp = QtWidgets.QPushButton("Clean Up...")
+        self.buttonCleanUp.setToolTip("Move old versions of this folder to its _archive folder")
+        self.buttonCleanUp.clicked.connect(self.cleanUp)
         
         self.filePathHLayout = QtWidgets.QHBoxLayout()
         self.filePathHLayout.addWidget(self.filePathLabel)
         self.filePathHLayout.addWidget(self.filePathTextBox)
         self.filePathHLayout.addWidget(self.buttonBrowse)
+        self.filePathHLayout.addWidget(self.buttonCleanUp)
+
+        #======================PROJECT SEARCH======================
+        self.searchLabel = QtWidgets.QLabel("Search:      ")
+
+        self.searchTextBox = QtWidgets.QLineEdit()
+        self.searchTextBox.setPlaceholderText("Search every shot of $JOB, e.g. lighting 040")
+        #Wait until the artist stops typing before searching
+        self.searchTimer = QtCore.QTimer(self)
+        self.searchTimer.setSingleShot(True)
+        self.searchTimer.timeout.connect(self.searchProject)
+        self.searchTextBox.textChanged.connect(lambda text: self.searchTimer.start(150))
+
+        self.latestCheckBox = QtWidgets.QCheckBox("Latest only")
+        self.latestCheckBox.setChecked(True)
+        self.latestCheckBox.toggled.connect(self.searchProject)
+
+        self.searchHLayout = QtWidgets.QHBoxLayout()
+        self.searchHLayout.addWidget(self.searchLabel)
+        self.searchHLayout.addWidget(self.searchTextBox)
+        self.searchHLayout.addWidget(self.latestCheckBox)
+
+        self.searchResultsList = QtWidgets.QListWidget()
+        self.searchResultsList.setVisible(False)
+        self.searchResultsList.itemActivated.connect(self.openSearchResult)
 
         #======================FILELIST======================
         self.fileListLabel = QtWidgets.QLabel("Files:        ")
@@ -42,12 +105,22 @@ class LoadFileApp(QtWidgets.QWidget):
         self.commentsContentLabel.setAlignment(QtCore.Qt.AlignTop)
         self.commentsContentLabel.setStyleSheet("color: #cccccc; background-color: #4b4b4b; min-width: 150px; padding-left: 5px; padding-right: 5px; margin-top: 5px")
         
+        self.snapshotLabel = QtWidgets.QLabel()
+        self.snapshotLabel.setAlignment(QtCore.Qt.AlignCenter)
+        self.snapshotLabel.setFixedSize(*version_metadata.SnapshotSize)
+
+        self.metadataLabel = QtWidgets.QLabel()
+        self.metadataLabel.setAlignment(QtCore.Qt.AlignTop)
+        self.metadataLabel.setStyleSheet("color: #999999; padding-left: 5px")
+
         self.versionsCombobox = QtWidgets.QComboBox()
         self.versionsCombobox.currentIndexChanged.connect(self.readComments)
 
         self.commentsVLayout = QtWidgets.QVBoxLayout()
         self.commentsVLayout.addWidget(self.commentsLabel)
         self.commentsVLayout.addWidget(self.commentsContentLabel)
+        self.commentsVLayout.addWidget(self.snapshotLabel)
+        self.commentsVLayout.addWidget(self.metadataLabel)
         self.commentsVLayout.addWidget(self.versionsCombobox)
 
 
@@ -56,13 +129,37 @@ class LoadFileApp(QtWidgets.QWidget):
         self.fileListHLayout.addWidget(self.filesList)
         self.fileListHLayout.addLayout(self.commentsVLayout)
 
+        #======================LOAD MODE======================
+        self.loadModeLabel = QtWidgets.QLabel("Load Mode:")
+
+        self.loadModeCombobox = QtWidgets.QComboBox()
+        self.loadModeCombobox.addItems(load_modes.Modes)
+        self.loadModeCombobox.currentIndexChanged.connect(self.modeChanged)
+
+        self.mergePatternTextBox = QtWidgets.QLineEdit()
+        self.mergePatternTextBox.setPlaceholderText("Nodes to merge, e.g. /obj/geo1 /stage/*")
+        self.mergePatternTextBox.setEnabled(False)
+
+        self.buttonRestore = QtWidgets.QPushButton("Restore")
+        self.buttonRestore.setToolTip("Un-bypass the nodes of a fast loaded scene and turn cooking back on")
+        self.buttonRestore.clicked.connect(self.restoreBypassed)
+
+        self.loadModeHLayout = QtWidgets.QHBoxLayout()
+        self.loadModeHLayout.addWidget(self.loadModeLabel)
+        self.loadModeHLayout.addWidget(self.loadModeCombobox)
+        self.loadModeHLayout.addWidget(self.mergePatternTextBox)
+        self.loadModeHLayout.addWidget(self.buttonRestore)
+
         #======================OPEN======================
         self.filePathButton = QtWidgets.QPushButton("Load")
         self.filePathButton.clicked.connect(self.openFile)
 
         self.mainVLayout = QtWidgets.QVBoxLayout()
         self.mainVLayout.addLayout(self.filePathHLayout)
+        self.mainVLayout.addLayout(self.searchHLayout)
+        self.mainVLayout.addWidget(self.searchResultsList)
         self.mainVLayout.addLayout(self.fileListHLayout)
+        self.mainVLayout.addLayout(self.loadModeHLayout)
         self.mainVLayout.addWidget(self.filePathButton)
         
         self.setLayout(self.mainVLayout)
@@ -74,53 +171,190 @@ class LoadFileApp(QtWidgets.QWidget):
         self.filePathTextBox.setText(folder)
 
     def listFiles(self):
-        unique_items = []
-        
-        if(os.path.exists(self.filePathTextBox.text())):
-            self.filePaths = glob.glob(os.path.join(self.filePathTextBox.text(), "*.hip"))
-            items = [os.path.splitext(os.path.basename(i))[0].rsplit('_v')[0] for i in self.filePaths]
-            unique_items = set(items)
+        self.index = get_index(self.filePathTextBox.text())
+        self.watch(self.filePathTextBox.text() if self.index else None)
         
         self.filesList.clear()
-        self.filesList.addItems(unique_items)
+        if(self.index):
+            self.filesList.addItems(self.index.names())
+
+    def watch(self, directory):
+        #New or deleted versions then come in through versionsChanged
+        if(self.watchedDirectory):
+            get_watcher().unwatch(self.watchedDirectory)
+        self.watchedDirectory = directory
+        if(directory):
+            get_watcher().watch(directory)
+
+    def versionsChanged(self, directory):
+        if(not self.watchedDirectory or normalize(directory) != normalize(self.watchedDirectory) or not self.index):
+            return
+        #Only add and remove the names that changed, so the selection stays
+        names = self.index.names()
+        listed = [self.filesList.item(row).text() for row in range(self.filesList.count())]
+        for row in reversed(range(len(listed))):
+            if(listed[row] not in names):
+                self.filesList.takeItem(row)
+        for row, name in enumerate(names):
+            if(row >= self.filesList.count() or self.filesList.item(row).text() != name):
+                self.filesList.insertItem(row, name)
+
+        if(self.filesList.selectedItems()):
+            versions = self.index.all_versions(self.filesList.selectedItems()[0].text())
+            listed = [self.versionsCombobox.itemText(i) for i in range(self.versionsCombobox.count())]
+            if(versions != listed):
+                current = self.versionsCombobox.currentText()
+                self.itemSelect()
+                #Stay on the version being looked at, if it's still there
+                if(current in versions):
+                    self.versionsCombobox.setCurrentIndex(versions.index(current))
+
+    def closeEvent(self, event):
+        self.watch(None)
+        super(LoadFileApp, self).closeEvent(event)
     
     def itemSelect(self):
         versions = []
-        if(os.path.exists(self.filePathTextBox.text())):
-            files = glob.glob(os.path.join(self.filePathTextBox.text(), "*.hip"))
-            versionfiles = [f for f in files if os.path.basename(f).startswith(self.filesList.selectedItems()[0].text() + '_v')]
-        if(versionfiles):
-            versions = [os.path.splitext(os.path.basename(v))[0].split('_v')[-1] for v in versionfiles]
+        if(self.index and self.filesList.selectedItems()):
+            versions = self.index.all_versions(self.filesList.selectedItems()[0].text())
         
         self.versionsCombobox.clear()
         self.versionsCombobox.addItems(versions)
-        if(versionfiles):
-            self.versionsCombobox.setCurrentIndex(len(versionfiles)-1)
+        if(versions):
+            self.versionsCombobox.setCurrentIndex(len(versions)-1)
     
     def readComments(self):
         self.commentsContentLabel.setText("")
-        commentsFile = os.path.join(self.filePathTextBox.text(), 'comments.json').replace('\\', '/')
-        if(os.path.exists(commentsFile)):
-            with open(commentsFile, 'r') as openfile:
-                lines = openfile.read()
-                try:
-                    commentsDict = json.loads(lines)
-                    self.commentsContentLabel.setText(commentsDict[self.filesList.selectedItems()[0].text() + '_v' + self.versionsCombobox.currentText()].replace('\\n', '\n'))
-                except:
-                    pass
+        self.metadataLabel.setText("")
+        self.snapshotLabel.clear()
+        if(self.index and self.filesList.selectedItems()):
+            directory = self.filePathTextBox.text()
+            key = self.filesList.selectedItems()[0].text() + '_v' + self.versionsCombobox.currentText()
+            comment = comment_store(directory).get(key)
+            if(comment):
+                self.commentsContentLabel.setText(comment.replace('\\n', '\n'))
+
+            #Versions saved before metadata was recorded have none
+            metadata = version_metadata.metadata_store(directory).get(key)
+            if(metadata):
+                self.metadataLabel.setText(version_metadata.describe(metadata))
+            snapshot = version_metadata.snapshot_path(directory, key)
+            if(os.path.exists(snapshot)):
+                self.snapshotLabel.setPixmap(QtGui.QPixmap(snapshot).scaled(
+                    self.snapshotLabel.size(), QtCore.Qt.KeepAspectRatio, QtCore.Qt.SmoothTransformation))
+
+    def searchProject(self):
+        text = self.searchTextBox.text().strip()
+        self.searchResultsList.clear()
+        self.searchResultsList.setVisible(bool(text))
+        if(not text):
+            return
+        root = hou.getenv("JOB")
+        if(not root or not os.path.isdir(root)):
+            self.searchResultsList.addItem("Set $JOB to the project folder to search it")
+            return
+
+        #Answer from the index right away, and crawl the project in the background
+        #once per session, searching again when it's done
+        if(self.projectIndex is None):
+            from project_index import get_project_index
+            self.projectIndex = get_project_index(root)
+            self.projectCrawl = ProjectCrawl(self.projectIndex, self)
+            self.projectCrawl.finished.connect(self.searchProject)
+            self.projectCrawl.start()
+
+        for result in self.projectIndex.search(text, self.latestCheckBox.isChecked()):
+            label = os.path.relpath(result["path"], root).replace('\\', '/')
+            if(result["comment"]):
+                label += "    " + result["comment"].replace('\\n', ' ')
+            item = QtWidgets.QListWidgetItem(label)
+            item.setData(QtCore.Qt.UserRole, result)
+            self.searchResultsList.addItem(item)
+        if(self.projectCrawl.isRunning()):
+            self.searchResultsList.addItem("Indexing the project...")
+
+    def openSearchResult(self, item):
+        result = item.data(QtCore.Qt.UserRole)
+        if(not result):
+            return
+        #Show the result's folder, then select its file and version
+        self.filePathTextBox.setText(result["directory"])
+        matches = self.filesList.findItems(result["name"], QtCore.Qt.MatchExactly)
+        if(matches):
+            self.filesList.setCurrentItem(matches[0])
+            if(result["version_text"]):
+                self.versionsCombobox.setCurrentText(result["version_text"])
+
+    def cleanUp(self):
+        if(not self.index):
+            return
+        import version_retention
+        #Show what would be archived before moving anything
+        decisions = version_retention.plan(self.filePathTextBox.text())
+        pruned = [d for d in decisions if not d[1]]
+        if(not pruned):
+            QtWidgets.QMessageBox.information(self, 'Clean Up', "Nothing to archive", QtWidgets.QMessageBox.Ok)
+            return
+
+        box = QtWidgets.QMessageBox(QtWidgets.QMessageBox.Question, 'Clean Up',
+            "Move {0} of {1} versions to {2}?".format(len(pruned), len(decisions), version_retention.ArchiveDir),
+            QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.Cancel, self)
+        box.setDetailedText(version_retention.report(decisions))
+        if(box.exec_() != QtWidgets.QMessageBox.Yes):
+            return
+
+        QtWidgets.QApplication.setOverrideCursor(QtCore.Qt.WaitCursor)
+        version_retention.apply(self.filePathTextBox.text(), decisions)
+        QtWidgets.QApplication.restoreOverrideCursor()
+        self.listFiles()
+
+    def modeChanged(self):
+        self.mergePatternTextBox.setEnabled(self.loadModeCombobox.currentText() == load_modes.Merge)
+
+    def restoreBypassed(self):
+        restored = load_modes.restore_bypassed()
+        hou.ui.setStatusMessage("{0} bypassed nodes restored, cooking is on".format(restored))
 
     def openFile(self):
-        filesWithVersion = [f for f in self.filePaths if self.filesList.selectedItems()[0].text() + '_v' in f]
-        if(len(filesWithVersion) > 0):
-            hipFileName = os.path.join(self.filePathTextBox.text(), self.filesList.selectedItems()[0].text() + '_v' + self.versionsCombobox.currentText() +'.hip').replace('\\', '/')
-        else:
-            hipFileName = os.path.join(self.filePathTextBox.text(), self.filesList.selectedItems()[0].text() +'.hip').replace('\\', '/')
+        hipFileName = self.index.path(self.filesList.selectedItems()[0].text(), self.versionsCombobox.currentText())
         
         QtWidgets.QApplication.setOverrideCursor(QtCore.Qt.WaitCursor)
-        hou.hipFile.load(hipFileName)
+        directory, fileName = os.path.split(hipFileName)
+        loadPath = hipFileName
+        if(not os.path.exists(hipFileName) and hip_store.has_version(directory, fileName)):
+            #Rebuild the file from the store, then give the scene its shot folder path back
+            loadPath = hip_store.restore(directory, fileName, os.path.join(LocalLoadDir, fileName))
+
+        mode = self.loadModeCombobox.currentText()
+        if(mode == load_modes.Merge):
+            load_modes.merge_load(loadPath, self.mergePatternTextBox.text())
+        elif(mode == load_modes.Fast):
+            bypassed = load_modes.fast_load(loadPath)
+            hou.ui.setStatusMessage("Cooking is off and {0} heavy nodes are bypassed. ".format(len(bypassed)) +
+                "Use Restore in the Load dialog to bring them back.")
+        else:
+            hou.hipFile.load(loadPath)
+        if(mode != load_modes.Merge and loadPath != hipFileName):
+            hou.hipFile.setName(hipFileName)
         QtWidgets.QApplication.restoreOverrideCursor()
         self.close()
 
+#The dialog is built once and shown again on every run
+_dialog = None
+
+def show():
+    global _dialog
+    if(_dialog is None):
+        _dialog = LoadFileApp()
+    else:
+        _dialog.reset()
+    _dialog.show()
+    _dialog.raise_()
+    _dialog.activateWindow()
+    return _dialog
+
 #Run app
-app = LoadFileApp()
-app.show()
\ No newline at end of file
+if(__name__ != "load_file_with_version"):
+    #Run as a script (menu or shelf): go through the imported module, so its dialog is reused
+    import load_file_with_version
+    load_file_with_version.show()
\ No newline at end of file
@@ -0,0 +1,60 @@
+"""Faster ways of getting into a scene than a full load, used by the Load dialog.
+
+Fast:  load with cooking off (Manual update mode) and the heavy SOP/LOP nodes
+       bypassed, so nothing reads caches or USD until the artist asks for it.
+       restore_bypassed() (the Load dialog's Restore button) puts those nodes
+       back; the Save dialog asks for it before saving such a scene.
+Merge: merge only the nodes matching a pattern into the current scene.
+"""
+import hou
+
+Full, Fast, Merge = "Full", "Fast (no cooking)", "Merge nodes"
+Modes = [Full, Fast, Merge]
+
+# Node types that read from disk and are bypassed by the fast load. Mark any
+# other node with the "heavy" user data to have it bypassed too.
+HeavyNodeTypes = ("filecache", "file", "alembic", "usdimport", "sublayer", "reference", "assetreference", "loadlayer")
+HeavyUserData = "heavy"
+# Set on the nodes bypassed by the fast load, so they can be restored.
+BypassedUserData = "fast_load_bypassed"
+
+
+def is_heavy(node):
+    if not isinstance(node, (hou.SopNode, hou.LopNode)) or node.isBypassed():
+        return False
+    name = node.type().nameComponents()[2]
+    return name in HeavyNodeTypes or node.userData(HeavyUserData) is not None
+
+
+def fast_load(path):
+    """Load PATH without cooking and bypass its heavy nodes. Returns the bypassed nodes."""
+    hou.setUpdateMode(hou.updateMode.Manual)
+    hou.hipFile.load(path, ignore_load_warnings=True)
+
+    bypassed = []
+    for node in hou.node("/").allSubChildren():
+        if is_heavy(node) and not node.isInsideLockedHDA():
+            node.bypass(True)
+            node.setUserData(BypassedUserData, "1")
+            bypassed.append(node)
+    return bypassed
+
+
+def fast_loaded_nodes():
+    """Nodes of the current scene still bypassed by fast_load."""
+    return [node for node in hou.node("/").allSubChildren() if node.userData(BypassedUserData) is not None]
+
+
+def restore_bypassed():
+    """Un-bypass the nodes bypassed by fast_load and cook again. Returns how many were restored."""
+    nodes = fast_loaded_nodes()
+    for node in nodes:
+        node.bypass(False)
+        node.destroyUserData(BypassedUserData)
+    hou.setUpdateMode(hou.updateMode.AutoUpdate)
+    return len(nodes)
+
+
+def merge_load(path, pattern):
+    """Merge the nodes of PATH matching PATTERN (e.g. "/obj/geo1 /stage/*") into the current scene."""
+    hou.hipFile.merge(path, node_pattern=pattern or "*", overwrite_on_conflict=False, ignore_load_warnings=True)
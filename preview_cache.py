@@ -0,0 +1,151 @@
+"""Process-wide cache of decoded clip preview frames.
+
+Previews are decoded once and kept in memory, keyed by their path and mtime,
+so hovering back over a clip plays at once, even after the browser is closed
+and opened again. The least recently used previews are dropped when the
+decoded frames go over the memory budget.
+"""
+from PySide2 import QtCore, QtGui
+from collections import OrderedDict
+import os, json
+
+# Memory the decoded frames may use, in bytes.
+Budget = 256 * 1024 * 1024
+# Delay used when the file doesn't say how long a frame lasts (24 fps).
+DefaultDelay = 42
+
+
+class PreviewFrameCache():
+    """Decoded frames and frame delays of the previews, evicted least recently used first."""
+
+    def __init__(self, budget=Budget):
+        self.budget = budget
+        self.size = 0
+        # (path, mtime) -> [frames, delays, complete, bytes]
+        self.entries = OrderedDict()
+
+    def decode(self, path, first_only=False):
+        """Read the frames of a preview. With FIRST_ONLY just the first one is read."""
+        if path.endswith(".sprite.jpg"):
+            return self.decodeSprite(path, first_only)
+
+        reader = QtGui.QImageReader(path)
+        frames, delays = [], []
+        while True:
+            image = reader.read()
+            if image.isNull():
+                break
+            frames.append(image)
+            delay = reader.nextImageDelay()
+            delays.append(delay if delay > 0 else DefaultDelay)
+            if first_only or not reader.canRead():
+                break
+        return frames, delays
+
+    def decodeSprite(self, path, first_only=False):
+        """Cut the frames out of a sprite sheet, using the grid described in its .json sidecar."""
+        try:
+            with open(os.path.splitext(path)[0] + ".json", "r") as f:
+                sheet = json.load(f)
+        except (OSError, ValueError):
+            return [], []
+        width, height = sheet["width"], sheet["height"]
+        count = 1 if first_only else sheet["frames"]
+
+        reader = QtGui.QImageReader(path)
+        if first_only:
+            # Only decode the top left tile.
+            reader.setClipRect(QtCore.QRect(0, 0, width, height))
+        image = reader.read()
+        if image.isNull():
+            return [], []
+
+        frames = []
+        for i in range(count):
+            column, row = i % sheet["columns"], i // sheet["columns"]
+            frames.append(image.copy(column * width, row * height, width, height))
+        return frames, [int(1000 / sheet["fps"])] * len(frames)
+
+    def store(self, key, frames, delays, complete):
+        cost = sum(frame.sizeInBytes() for frame in frames)
+        old = self.entries.pop(key, None)
+        if old:
+            self.size -= old[3]
+        self.entries[key] = [frames, delays, complete, cost]
+        self.size += cost
+
+        # Drop the oldest previews until we are back under budget, but keep this one.
+        while self.size > self.budget and len(self.entries) > 1:
+            oldest_key, oldest = self.entries.popitem(last=False)
+            self.size -= oldest[3]
+
+    def first(self, path, mtime):
+        """First frame of a preview, used for the still thumbnails. None if it can't be read."""
+        key = (path, mtime)
+        entry = self.entries.get(key)
+        if entry is None:
+            frames, delays = self.decode(path, first_only=True)
+            self.store(key, frames, delays, False)
+            entry = self.entries[key]
+        else:
+            self.entries.move_to_end(key)
+        return entry[0][0] if entry[0] else None
+
+    def frames(self, path, mtime):
+        """All the frames and delays (in ms) of a preview, decoding them on the first call."""
+        key = (path, mtime)
+        entry = self.entries.get(key)
+        if entry is None or not entry[2]:
+            frames, delays = self.decode(path)
+            self.store(key, frames, delays, True)
+            entry = self.entries[key]
+        else:
+            self.entries.move_to_end(key)
+        return entry[0], entry[1]
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+
+class PreviewPlayer(QtCore.QObject):
+    """Steps through the cached frames of one preview."""
+
+    frameChanged = QtCore.Signal()
+
+    def __init__(self, parent=None):
+        super(PreviewPlayer, self).__init__(parent)
+        self.path = None
+        self.frames, self.delays = [], []
+        self.current = 0
+        self.timer = QtCore.QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.nextFrame)
+
+    def play(self, path, mtime):
+        self.path = path
+        self.frames, self.delays = previewCache.frames(path, mtime)
+        self.current = 0
+        if len(self.frames) > 1:
+            self.timer.start(self.delays[0])
+        self.frameChanged.emit()
+
+    def stop(self):
+        self.timer.stop()
+        self.current = 0
+        self.frameChanged.emit()
+
+    def isPlaying(self):
+        return self.timer.isActive()
+
+    def image(self):
+        return self.frames[self.current] if self.frames else None
+
+    def nextFrame(self):
+        self.current = (self.current + 1) % len(self.frames)
+        self.timer.start(self.delays[self.current])
+        self.frameChanged.emit()
+
+
+# Shared by every browser opened in this Houdini session.
+previewCache = PreviewFrameCache()
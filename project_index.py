@@ -0,0 +1,182 @@
+"""Index of every versioned .hip file under a project root, for searching across shots.
+
+The project is crawled in parallel and every version is stored in SQLite with
+its comment and metadata, so a search like "lighting 040" answers from the
+database instead of walking the share. Refreshing walks the folders again but
+only re-reads the ones whose files, comments or metadata changed.
+
+Search from a terminal:
+    python project_index.py C:/Path/To/Project lighting 040
+"""
+import os, sys, json, sqlite3, threading
+from concurrent.futures import ThreadPoolExecutor
+import hip_store
+from version_index import Extension, parse
+from journal_store import JournalStore
+
+# The database lives on the local disk, SQLite does not like network shares.
+IndexPath = os.path.join(os.path.expanduser("~"), ".hip_project_index.db")
+# Folders scanned at the same time. Crawling a share is mostly waiting on it.
+Workers = 16
+# Folders never looked into: the store, snapshots, archives...
+SkipDirs = (hip_store.StoreDir, ".snapshots", "_archive", "backup")
+
+SchemaVersion = 1
+Schema = """
+CREATE TABLE IF NOT EXISTS directories (
+    path TEXT PRIMARY KEY,
+    root TEXT NOT NULL,
+    stamp TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS versions (
+    path TEXT PRIMARY KEY,
+    directory TEXT NOT NULL,
+    name TEXT NOT NULL,
+    version INTEGER,
+    version_text TEXT,
+    mtime REAL NOT NULL,
+    size INTEGER,
+    comment TEXT,
+    metadata TEXT
+);
+CREATE INDEX IF NOT EXISTS versions_directory ON versions (directory);
+"""
+
+
+def _stamp(entries):
+    """What changes when a folder's versions, comments or metadata change."""
+    return json.dumps(sorted((name, stat.st_mtime, stat.st_size) for name, stat in entries.items()))
+
+
+def scan(path):
+    """List one folder. Returns (subfolders, stamp, {filename: stat}) and never touches the database."""
+    subdirs, files = [], {}
+    try:
+        for entry in os.scandir(path):
+            if entry.is_dir():
+                if entry.name not in SkipDirs:
+                    subdirs.append(entry.path.replace("\\", "/"))
+            elif entry.name.endswith(Extension) or entry.name.startswith(("comments.", "metadata.")):
+                files[entry.name] = entry.stat()
+    except OSError:
+        return [], None, {}
+    manifests = os.path.join(hip_store.store_path(path), "manifests")
+    if os.path.isdir(manifests):
+        files[hip_store.StoreDir] = os.stat(manifests)
+    return subdirs, _stamp(files), files
+
+
+def read_versions(path, files):
+    """Rows of the versions of one folder, with their comment and metadata."""
+    comments = JournalStore(path, "comments").all()
+    metadata = JournalStore(path, "metadata").all()
+    stats = dict((f, s) for f, s in files.items() if f.endswith(Extension))
+    for filename in hip_store.versions(path):
+        if filename not in stats and filename.endswith(Extension):
+            stats[filename] = os.stat(hip_store.manifest_path(path, filename))
+
+    rows = []
+    for filename, stat in stats.items():
+        name, number, text = parse(filename)
+        key = os.path.splitext(filename)[0]
+        meta = metadata.get(key)
+        rows.append((path + "/" + filename, path, name, number, text, stat.st_mtime,
+                     meta.get("size") if meta else stat.st_size, comments.get(key),
+                     json.dumps(meta) if meta else None))
+    return rows
+
+
+class ProjectIndex():
+    """Versions of every shot folder under one project root, stored in SQLite."""
+
+    def __init__(self, root_path, db_path=IndexPath):
+        self.root_path = root_path.replace("\\", "/").rstrip("/")
+        # Refreshed from a background thread while the dialog searches.
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        if self.db.execute("PRAGMA user_version").fetchone()[0] != SchemaVersion:
+            self.db.executescript("DROP TABLE IF EXISTS versions; DROP TABLE IF EXISTS directories;")
+            self.db.execute("PRAGMA user_version = {0}".format(SchemaVersion))
+        self.db.executescript(Schema)
+
+    def refresh(self, workers=Workers):
+        """Crawl the project, re-reading only the folders that changed. Returns how many did."""
+        with self.lock:
+            known = dict(self.db.execute("SELECT path, stamp FROM directories WHERE root = ?",
+                                         (self.root_path,)).fetchall())
+        found = {}
+        changed = {}
+        with ThreadPoolExecutor(workers) as pool:
+            pending = [pool.submit(scan, self.root_path)]
+            paths = [self.root_path]
+            while pending:
+                future, path = pending.pop(0), paths.pop(0)
+                subdirs, stamp, files = future.result()
+                found[path] = stamp
+                if stamp != known.get(path):
+                    changed[path] = pool.submit(read_versions, path, files)
+                for subdir in subdirs:
+                    pending.append(pool.submit(scan, subdir))
+                    paths.append(subdir)
+
+            with self.lock, self.db:
+                for path in set(known) - set(found):
+                    self.db.execute("DELETE FROM versions WHERE directory = ?", (path,))
+                    self.db.execute("DELETE FROM directories WHERE path = ?", (path,))
+                for path, rows in changed.items():
+                    self.db.execute("DELETE FROM versions WHERE directory = ?", (path,))
+                    self.db.executemany("INSERT OR REPLACE INTO versions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                        rows.result())
+                    self.db.execute("INSERT OR REPLACE INTO directories VALUES (?, ?, ?)",
+                                    (path, self.root_path, found[path]))
+        return len(changed)
+
+    def search(self, text, latest=False, limit=200):
+        """Versions whose folder, name or comment contain every word of TEXT, newest first.
+
+        With LATEST, only the latest version of each file name is returned.
+        """
+        query = ("SELECT path, directory, name, version, version_text, mtime, size, comment, metadata "
+                 "FROM versions WHERE (directory = ? OR directory LIKE ? ESCAPE '\\')")
+        root = self.root_path.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        args = [self.root_path, root + "/%"]
+        for word in text.split():
+            query += (" AND (instr(lower(directory), lower(?)) > 0 OR instr(lower(name), lower(?)) > 0"
+                      " OR instr(lower(ifnull(comment, '')), lower(?)) > 0)")
+            args += [word, word, word]
+        if latest:
+            query += (" AND ifnull(version, 0) = (SELECT ifnull(max(version), 0) FROM versions AS other"
+                      " WHERE other.directory = versions.directory AND other.name = versions.name)")
+        query += " ORDER BY mtime DESC LIMIT ?"
+        args.append(limit)
+        with self.lock:
+            rows = self.db.execute(query, args).fetchall()
+        results = []
+        for row in rows:
+            result = dict(row)
+            result["metadata"] = json.loads(row["metadata"]) if row["metadata"] else None
+            results.append(result)
+        return results
+
+
+# Root -> ProjectIndex, shared by every dialog of the session.
+_indexes = {}
+
+
+def get_project_index(root_path):
+    """Return the ProjectIndex of ROOT_PATH, the same object on every call. Call refresh() to crawl."""
+    key = os.path.normcase(os.path.abspath(root_path))
+    if key not in _indexes:
+        _indexes[key] = ProjectIndex(root_path)
+    return _indexes[key]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage:\n\tpython project_index.py C:/Path/To/Project [words to search]")
+        sys.exit(1)
+    index = ProjectIndex(sys.argv[1])
+    print("{0} folders re-read".format(index.refresh()))
+    for result in index.search(" ".join(sys.argv[2:])):
+        print("{0}  {1}".format(result["path"], (result["comment"] or "").replace("\\n", " ")))
@@ -1,23 +1,117 @@
 from PySide2 import QtWidgets, QtCore
-import os, glob
+import os, time, tempfile
 import hou
-import json
+import hip_store
+from version_index import get_index
+from journal_store import comment_store
+import version_metadata
+import load_modes
+from version_watcher import get_watcher, normalize
+
+#Scenes are written here first, then copied to the file path in the background
+LocalSaveDir = os.path.join(tempfile.gettempdir(), "houdini_saves")
+#Default of the Deduplicate option, see hip_store
+DedupStorage = False
+
+class HipTransfer(QtCore.QThread):
+    """Copies a scene saved on the local disk to its final path on a background thread.
+
+    With DEDUP the scene goes into the deduplicated store of the folder instead of a full copy.
+    """
+
+    progress = QtCore.Signal(int)
+    landed = QtCore.Signal()
+    failed = QtCore.Signal(str)
+
+    ChunkSize = 8 * 1024 * 1024
+
+    def __init__(self, localPath, finalPath, dedup=False, parent=None):
+        super(HipTransfer, self).__init__(parent)
+        self.localPath = localPath
+        self.finalPath = finalPath
+        self.dedup = dedup
+
+    def run(self):
+        if(self.dedup):
+            self.runDedup()
+            return
+        started = time.time()
+        partPath = self.finalPath + '.part'
+        try:
+            #Copy next to the final file, then rename it into place in one go
+            total = max(os.path.getsize(self.localPath), 1)
+            copied = 0
+            with open(self.localPath, 'rb') as src, open(partPath, 'wb') as dst:
+                while True:
+                    chunk = src.read(self.ChunkSize)
+                    if(not chunk):
+                        break
+                    dst.write(chunk)
+                    copied += len(chunk)
+                    self.progress.emit(int(copied * 100 / total))
+                dst.flush()
+                os.fsync(dst.fileno())
+
+            #If the artist saved again over the final path meanwhile, keep that one
+            if(os.path.exists(self.finalPath) and os.path.getmtime(self.finalPath) > started):
+                os.remove(partPath)
+            else:
+                os.replace(partPath, self.finalPath)
+            os.remove(self.localPath)
+        except OSError as e:
+            if(os.path.exists(partPath)):
+                os.remove(partPath)
+            self.failed.emit(str(e))
+            return
+        self.landed.emit()
+
+    def runDedup(self):
+        try:
+            #Only the chunks not already in the store are written
+            hip_store.store(self.localPath, os.path.dirname(self.finalPath),
+                            self.finalPath, self.progress.emit)
+            os.remove(self.localPath)
+        except OSError as e:
+            self.failed.emit(str(e))
+            return
+        self.landed.emit()
 
 class SaveFileApp(QtWidgets.QWidget):
 
     def __init__(self):
         super(SaveFileApp, self).__init__()
-        self.fileCollection = []
+        self.index = None
         self.version = 0
+        self.watchedDirectory = None
         #self.extension = self.getLicense()
         self.initUI()
-        self.checkDir()
+        get_watcher().changed.connect(self.versionsChanged)
+        #Look at the folder once the window is up, not before it shows
+        QtCore.QTimer.singleShot(0, self.checkDir)
+
+    def reset(self):
+        """Get ready to be shown again, for the scene open now."""
+        self.commentsTextBox.clear()
+        self.fileNameTextBox.blockSignals(True)
+        self.fileNameTextBox.setText(self.currentName())
+        self.fileNameTextBox.blockSignals(False)
+        path = self.currentPath()
+        if(path != self.filePathTextBox.text()):
+            self.filePathTextBox.setText(path)
+        else:
+            QtCore.QTimer.singleShot(0, self.checkDir)
+
+    def currentPath(self):
+        return hou.homeHoudiniDirectory() if hou.hipFile.isNewFile() else os.path.dirname(hou.hipFile.path())
+
+    def currentName(self):
+        return os.path.splitext(hou.hipFile.basename())[0].rsplit('_v')[0]
 
     def initUI(self):
         #======================FILEPATH======================
         self.filePathLabel = QtWidgets.QLabel("File Path:   ")
 
-        self.filePathTextBox = QtWidgets.QLineEdit(hou.homeHoudiniDirectory() if hou.hipFile.isNewFile() else os.path.dirname(hou.hipFile.path()))
+        self.filePathTextBox = QtWidgets.QLineEdit(self.currentPath())
         self.filePathTextBox.textChanged.connect(self.checkDir)
 
         self.buttonBrowse = QtWidgets.QPushButton("Browse")
@@ -31,7 +125,7 @@ class SaveFileApp(QtWidgets.QWidget):
         #======================FILENAME======================
         self.fileNameLabel = QtWidgets.QLabel("File Name: ")
 
-        self.fileNameTextBox = QtWidgets.QLineEdit(os.path.splitext(hou.hipFile.basename())[0].rsplit('_v')[0])
+        self.fileNameTextBox = QtWidgets.QLineEdit(self.currentName())
         self.fileNameTextBox.textChanged.connect(self.checkFile)
         
         self.extensionLabel = QtWidgets.QLabel(".hip")
@@ -59,14 +153,22 @@ class SaveFileApp(QtWidgets.QWidget):
         self.commentsHLayout.addWidget(self.commentsTextBox)
 
         #======================SAVE======================
+        self.dedupCheckBox = QtWidgets.QCheckBox("Deduplicate")
+        self.dedupCheckBox.setToolTip("Only store what changed since the previous versions of this folder")
+        self.dedupCheckBox.setChecked(DedupStorage)
+
         self.buttonSave = QtWidgets.QPushButton("Save")
         self.buttonSave.clicked.connect(self.saveFile)
 
+        self.saveHLayout = QtWidgets.QHBoxLayout()
+        self.saveHLayout.addWidget(self.dedupCheckBox)
+        self.saveHLayout.addWidget(self.buttonSave, 1)
+
         self.mainVLayout = QtWidgets.QVBoxLayout()
         self.mainVLayout.addLayout(self.filePathHLayout)
         self.mainVLayout.addLayout(self.fileNameHLayout)
         self.mainVLayout.addLayout(self.commentsHLayout)
-        self.mainVLayout.addWidget(self.buttonSave)
+        self.mainVLayout.addLayout(self.saveHLayout)
 
         self.setLayout(self.mainVLayout)
         self.setMinimumSize(500, 250)
@@ -105,6 +207,19 @@ class SaveFileApp(QtWidgets.QWidget):
             )
             return
 
+        #A fast loaded scene would be saved with its heavy nodes bypassed and cooking off
+        bypassed = load_modes.fast_loaded_nodes()
+        if(bypassed):
+            answer = QtWidgets.QMessageBox.question(self,
+                'Fast loaded scene',
+                "{0} heavy nodes are still bypassed by the fast load and cooking is off.\n".format(len(bypassed)) +
+                "Restore them before saving?",
+                QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No | QtWidgets.QMessageBox.Cancel)
+            if(answer == QtWidgets.QMessageBox.Cancel):
+                return
+            if(answer == QtWidgets.QMessageBox.Yes):
+                load_modes.restore_bypassed()
+
         #Save .hip and .txt with the comments
         saveFilePath = os.path.join(
             self.filePathTextBox.text(),
@@ -112,48 +227,63 @@ class SaveFileApp(QtWidgets.QWidget):
             '_v' + format(self.version, '03d') 
         ).replace('\\', '/')
 
+        #Save the .hip on the local disk first and get control back right away,
+        #then copy it to the file path in the background
+        if(not os.path.exists(LocalSaveDir)):
+            os.makedirs(LocalSaveDir)
+        #A file of its own, another save may still be copying the previous one
+        handle, localPath = tempfile.mkstemp(dir=LocalSaveDir, suffix='.hip')
+        os.close(handle)
+        saveStart = time.time()
+        hou.hipFile.save(localPath)
+        saveDuration = time.time() - saveStart
         hou.hipFile.setName(saveFilePath + '.hip')
-        hou.hipFile.save(saveFilePath + '.hip')
-
-        if(len(self.commentsTextBox.toPlainText()) > 0):
-
-            #Check invalid chars
-            multiLineComment = self.commentsTextBox.toPlainText().replace('\n', '\\n')
-            commentsPath = os.path.join(self.filePathTextBox.text(), "comments.json")
-            if(os.path.exists(commentsPath)):
-                with open(commentsPath, 'r') as openfile:
-                    lines = openfile.read()
-                    if(len(lines) > 0):
-                        try:
-                            commentsDict = json.loads(lines)
-                            commentsDict[self.fileNameTextBox.text() + '_v' + format(self.version, '03d')] = multiLineComment
-                        except:
-                            msg = QtWidgets.QMessageBox()
-                            msg.setIcon(QtWidgets.QMessageBox.Information)
-
-                            msg.setWindowTitle("JSON Error")
-                            msg.setText("Error while parsin {0}".format(commentsPath))
-                            msg.setInformativeText("Do you wish to overwrite it in order to save this comment?")
-                            msg.setStandardButtons(QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No)
-                            retval = msg.exec_()
-                            if(retval == QtWidgets.QMessageBox.Yes):
-                                commentsDict = {self.fileNameTextBox.text() + '_v' + format(self.version, '03d'): multiLineComment}
-                            else:
-                                return
-                    else:
-                        commentsDict = {self.fileNameTextBox.text() + '_v' + format(self.version, '03d'): multiLineComment}
-            else:
-                commentsDict = {self.fileNameTextBox.text() + '_v' + format(self.version, '03d'): multiLineComment}
 
-            with open(commentsPath, "w") as outfile:
-                outfile.write(json.dumps(commentsDict, indent=4))
+        index = self.index
+        #Saving again before this one lands gets the next version
+        if(index):
+            index.reserve(saveFilePath + '.hip')
+        directory = self.filePathTextBox.text()
+        key = self.fileNameTextBox.text() + '_v' + format(self.version, '03d')
+        #Stats shown by the Load dialog, so versions can be told apart without loading them
+        metadata = version_metadata.capture(localPath, saveDuration)
+        #Taken now, while the viewport still shows what was saved, and only moved to the share once it landed
+        snapshot = version_metadata.snapshot(os.path.splitext(localPath)[0] + '.jpg')
+        multiLineComment = self.commentsTextBox.toPlainText().replace('\n', '\\n')
+        version = self.version
+
+        def landed():
+            #Only record the version once the file is in its final place
+            if(index):
+                index.add(saveFilePath + '.hip')
+                index.release(saveFilePath + '.hip')
+            if(len(multiLineComment) > 0):
+                comment_store(directory).set(key, multiLineComment)
+            version_metadata.metadata_store(directory).set(key, metadata)
+            version_metadata.publish_snapshot(snapshot, directory, key)
+            hou.ui.setStatusMessage("File saved: {0} (version {1})".format(saveFilePath + '.hip', version))
+
+        def failed(error):
+            if(index):
+                index.release(saveFilePath + '.hip')
+            if(snapshot and os.path.exists(snapshot)):
+                os.remove(snapshot)
+            hou.ui.setStatusMessage("")
+            QtWidgets.QMessageBox.warning(hou.qt.mainWindow(),
+                'Save failed',
+                "Could not copy the file to {0}:\n{1}\n\n".format(saveFilePath + '.hip', error) +
+                "The scene is still saved in {0}".format(localPath),
+                QtWidgets.QMessageBox.Ok)
+
+        #The transfer belongs to Houdini's main window so it outlives this dialog
+        transfer = HipTransfer(localPath, saveFilePath + '.hip', self.dedupCheckBox.isChecked(), hou.qt.mainWindow())
+        transfer.progress.connect(lambda percent: hou.ui.setStatusMessage(
+            "Saving {0}... {1}%".format(os.path.basename(saveFilePath) + '.hip', percent)))
+        transfer.landed.connect(landed)
+        transfer.failed.connect(failed)
+        transfer.finished.connect(transfer.deleteLater)
+        transfer.start()
 
-        QtWidgets.QMessageBox.information(self, 
-                'File saved',
-                "File name: {0}\n".format(self.fileNameTextBox.text()) +
-                "Version: {0}".format(self.version),
-                 QtWidgets.QMessageBox.Ok)
-        
         self.close()
     
     def browsePath(self):
@@ -162,19 +292,30 @@ class SaveFileApp(QtWidgets.QWidget):
             self.filePathTextBox.setText(folder)
 
     def checkDir(self):
-        if(os.path.exists(self.filePathTextBox.text())):
-            self.fileCollection = glob.glob(os.path.join(self.filePathTextBox.text(), "*.hip"))
+        self.index = get_index(self.filePathTextBox.text())
+        #Someone else saving a version into this folder bumps the next version number
+        if(self.watchedDirectory):
+            get_watcher().unwatch(self.watchedDirectory)
+        self.watchedDirectory = self.filePathTextBox.text() if self.index else None
+        if(self.watchedDirectory):
+            get_watcher().watch(self.watchedDirectory)
         self.checkFile()
 
+    def versionsChanged(self, directory):
+        if(self.watchedDirectory and normalize(directory) == normalize(self.watchedDirectory)):
+            self.checkFile()
+
+    def closeEvent(self, event):
+        if(self.watchedDirectory):
+            get_watcher().unwatch(self.watchedDirectory)
+            self.watchedDirectory = None
+        super(SaveFileApp, self).closeEvent(event)
+
     def checkFile(self):
         #Check fields are not empty
         if(not self.fileNameTextBox.text()):
             return
-        self.version = 1
-        versionfiles = [f for f in self.fileCollection if (self.fileNameTextBox.text() + '_v' in f and os.path.basename(f).startswith(self.fileNameTextBox.text() + '_v'))]
-        if(versionfiles):
-            versions = [int(os.path.splitext(os.path.basename(v))[0].split('_v')[-1]) for v in versionfiles]
-            self.version = max(versions) + 1
+        self.version = self.index.next_version(self.fileNameTextBox.text()) if self.index else 1
         
         self.extensionLabel.setText('_v' + format(self.version, '03d') + '.hip')
         self.versionLabel.setText("Version: " + format(self.version, '03d'))
@@ -190,6 +331,22 @@ class SaveFileApp(QtWidgets.QWidget):
         else:
             return '.hip'
 
+#The dialog is built once and shown again on every run
+_dialog = None
+
+def show():
+    global _dialog
+    if(_dialog is None):
+        _dialog = SaveFileApp()
+    else:
+        _dialog.reset()
+    _dialog.show()
+    _dialog.raise_()
+    _dialog.activateWindow()
+    return _dialog
+
 #Run app
-app = SaveFileApp()
-app.show()
\ No newline at end of file
+if(__name__ != "save_file_with_version"):
+    #Run as a script (menu or shelf): go through the imported module, so its dialog is reused
+    import save_file_with_version
+    save_file_with_version.show()
\ No newline at end of file
@@ -0,0 +1,58 @@
+"""Time it takes the Load and Save dialogs to show up, run from Houdini's Python Shell:
+
+    import startup_benchmark
+    startup_benchmark.run()
+
+The first open includes importing the module and building the dialog, the
+re-opens only show the dialog built the first time. Time to window is
+measured up to the first paint of the dialog.
+"""
+from PySide2 import QtWidgets, QtCore
+import sys, time, importlib
+
+Modules = ["load_file_with_version", "save_file_with_version"]
+# Re-opens should stay under this many milliseconds.
+Target = 100.0
+
+
+class FirstPaint(QtCore.QObject):
+    """Records when the watched widget is painted for the first time."""
+
+    def __init__(self):
+        super(FirstPaint, self).__init__()
+        self.time = None
+
+    def eventFilter(self, obj, event):
+        if(event.type() == QtCore.QEvent.Paint and self.time is None):
+            self.time = time.perf_counter()
+        return False
+
+
+def time_to_window(moduleName):
+    """Milliseconds from running the entry point to the first paint of its dialog."""
+    start = time.perf_counter()
+    module = sys.modules.get(moduleName) or importlib.import_module(moduleName)
+    if(module._dialog is None):
+        # First open: importing the module and building the dialog count too.
+        dialog = module.show()
+    else:
+        module._dialog.close()
+        QtWidgets.QApplication.processEvents()
+        start = time.perf_counter()
+        dialog = module.show()
+    paint = FirstPaint()
+    dialog.installEventFilter(paint)
+    while(paint.time is None and time.perf_counter() - start < 10):
+        QtWidgets.QApplication.processEvents()
+    dialog.removeEventFilter(paint)
+    return ((paint.time or time.perf_counter()) - start) * 1000
+
+
+def run(runs=5):
+    for moduleName in Modules:
+        first = time_to_window(moduleName)
+        reopens = sorted(time_to_window(moduleName) for i in range(runs))
+        median = reopens[len(reopens) // 2]
+        print("{0}: first open {1:.0f} ms, re-open {2:.0f} ms (median of {3}) {4}".format(
+            moduleName, first, median, runs, "OK" if median < Target else "over {0:.0f} ms".format(Target)))
+        sys.modules[moduleName]._dialog.close()
@@ -0,0 +1,417 @@
+"""Batch thumbnail generation for the Clip Browser.
+
+Clips are split into work units and rendered by a pool of headless hython
+workers. Each worker runs this same file, reads work units as JSON lines on
+stdin and reports every rendered clip back on stdout, so ffmpeg can encode a
+clip while the worker is already rendering the next one.
+
+Run standalone as a worker:
+    hython thumbnail_farm.py
+
+With THUMBNAIL_FAKE_HOU set, workers use fake_hou.py instead of Houdini and can
+be started with plain Python, see fake_hou.py.
+"""
+import os, sys, json, math, queue, shutil, tempfile, threading, subprocess
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+import thumbnail_manifest
+
+# Executable used to start the workers and how many of them run at once.
+# With Workers = 0 the clips are rendered in the current Houdini session.
+Hython = os.environ.get("HYTHON", "hython")
+Workers = 4
+# Smallest number of clips of an agent sent to a worker in one go.
+UnitSize = 10
+# Extra room left around the agent when framing the camera.
+FramePadding = 1.1
+# Size of the preview frames, in pixels, for each resolution preset.
+ResolutionPresets = {"small": (128, 128), "medium": (200, 200), "large": (320, 320)}
+# Format of the previews: "gif", "webp" (animated WebP) or "sprite" (every
+# frame tiled in a single JPEG, with a .json sidecar describing the grid).
+PreviewFormat = "gif"
+PreviewSuffixes = {"gif": ".gif", "webp": ".webp", "sprite": ".sprite.jpg"}
+# Every line a worker writes for the coordinator starts with this marker,
+# anything else on stdout (Houdini warnings, prints...) is ignored.
+Marker = "@@thumbnail "
+
+
+@dataclass
+class PreviewPolicy:
+    """Bounds on how much of a clip gets rendered into its preview."""
+    # Most frames a preview may have. Longer clips skip frames to fit.
+    max_frames: int = 96
+    # Most seconds of animation shown. Longer clips are cut.
+    max_duration: float = 10.0
+    # Frame rate of the animation.
+    fps: float = 24.0
+    resolution: str = "medium"
+
+    def frame_range(self, start_frame, end_frame):
+        """Return the (start, end, step) to render for an animation going from START_FRAME to END_FRAME."""
+        end_frame = min(end_frame, start_frame + self.max_duration * self.fps - 1)
+        step = max(1, int(math.ceil((end_frame - start_frame + 1) / float(self.max_frames))))
+        return start_frame, end_frame, step
+
+    def playback_fps(self, step):
+        """Frame rate the preview is encoded at, so skipping frames keeps the real speed."""
+        return self.fps / step
+
+    def size(self):
+        return ResolutionPresets[self.resolution]
+
+
+def preview_path(clip_path, preview_format=PreviewFormat):
+    """Path of the preview of a clip: "Walk.fbx" -> "Walk.gif", "Walk.sprite.jpg"..."""
+    return os.path.splitext(clip_path)[0] + PreviewSuffixes[preview_format]
+
+
+def split_work(clips, workers=Workers, unit_size=UnitSize):
+    """Split the list of clips into work units holding the clips of a single agent.
+
+    An agent is split in at most WORKERS units, but never in units smaller than
+    UNIT_SIZE, so each worker loads the agent as few times as possible.
+    """
+    agents = OrderedDict()
+    for clip in clips:
+        agents.setdefault((clip["agent_name"], clip["agent_path"]), []).append(clip)
+
+    units = []
+    for agent_clips in agents.values():
+        size = max(unit_size, int(math.ceil(len(agent_clips) / float(max(workers, 1)))))
+        units.extend(agent_clips[i:i + size] for i in range(0, len(agent_clips), size))
+    return units
+
+
+def frame_camera(cam_node, bbox):
+    """Place an orthographic camera in front of the bounding box, looking down -Z."""
+    center = bbox.center()
+    size = bbox.sizevec()
+    cam_node.parmTuple("t").set((center[0], center[1], bbox.maxvec()[2] + size[2] + 10))
+    cam_node.parmTuple("r").set((0, 0, 0))
+    cam_node.parm("projection").set(1)
+    cam_node.parm("orthowidth").set(max(size[0], size[1]) * FramePadding)
+
+
+class AgentScaffold():
+    """Geometry, camera and OpenGL nodes reused to render every clip of one agent.
+
+    The agent skin is imported once; for each clip only the Agent Clip parameters
+    change. The camera is framed on the first clip and kept for the rest.
+    """
+
+    def __init__(self, hou, agent_name, agent_path, policy):
+        self.hou = hou
+        self.policy = policy
+        obj = hou.node("/obj/")
+
+        # Create a Geometry node.
+        self.geo = obj.createNode("geo", "agent_{0}".format(agent_name))
+        try:
+            # Create an Agent node and point to the .FBX file.
+            agent_node = self.geo.createNode("agent")
+            agent_node.parm("input").set(2)
+            agent_node.parm("fbxfile").set(agent_path)
+
+            self.clip_node = self.geo.createNode("agentclip::2.0")
+            self.clip_node.setFirstInput(agent_node)
+            self.clip_node.parm("source1").set(1)
+            self.clip_node.parm("setcurrentclip").set(True)
+            self.clip_node.setGenericFlag(hou.nodeFlag.Display, True)
+            self.clip_node.setGenericFlag(hou.nodeFlag.Render, True)
+
+            # Create a Camera node with a square resolution.
+            self.cam_node = obj.createNode("cam", "cam_{0}".format(agent_name))
+            self.cam_node.parmTuple("res").set(policy.size())
+            self.framed = False
+
+            # Create an OpenGL node in /out that renders the agent through the camera.
+            self.opengl_node = hou.node("/out/").createNode("opengl", "openGL_{0}".format(agent_name))
+            self.opengl_node.parm("trange").set(1)
+            self.opengl_node.parm("camera").set(self.cam_node.path())
+            self.opengl_node.parm("vobjects").set(self.geo.name())
+        except Exception:
+            self.destroy()
+            raise
+
+    def render(self, clip, frames_dir):
+        """Render CLIP as JPEGs inside FRAMES_DIR, within the bounds of the policy.
+
+        The frames are numbered from 0 with no gaps, whatever the frame step.
+        Returns (start_frame, end_frame, step).
+        """
+        # Swap the clip on the Agent Clip node.
+        self.clip_node.parm("file1").set(clip["clip_path"])
+        self.clip_node.parm("name1").set(clip["clip_name"])
+        self.clip_node.parm("currentclip").set(clip["clip_name"])
+        clip_geo = self.clip_node.geometry()
+
+        # Frame the camera on the bounding box of the first clip only.
+        if not self.framed:
+            frame_camera(self.cam_node, clip_geo.boundingBox())
+            self.framed = True
+
+        # Set the Frame Range to the begining and end of the animation,
+        # limited by the preview policy.
+        start_frame, end_frame, step = self.policy.frame_range(
+            self.hou.timeToFrame(clip_geo.prims()[0].clipTimes()[0]),
+            self.hou.timeToFrame(clip_geo.prims()[0].clips()[0].length()))
+        self.opengl_node.parmTuple("f").set((start_frame, end_frame, step))
+
+        # Set the output path, numbering the frames 0, 1, 2...
+        self.opengl_node.parm("picture").set(frames_dir.replace("\\", "/") +
+                                             "/frame_`padzero(4, round(($F - {0}) / {1}))`.jpeg".format(start_frame, step))
+        # Run the OpenGL render.
+        self.opengl_node.render()
+        return start_frame, end_frame, step
+
+    def destroy(self):
+        for name in ("opengl_node", "cam_node", "geo"):
+            node = getattr(self, name, None)
+            if node is not None:
+                node.destroy()
+                setattr(self, name, None)
+
+
+def render_unit(hou, unit, emit, scaffolds):
+    """Render every clip of a work unit, calling EMIT with one result dictionary per clip.
+
+    A work unit is a dictionary with the "clips" of a single agent to render and
+    the "policy" to use. SCAFFOLDS keeps the AgentScaffold of the last agent
+    rendered, so the next unit of the same agent doesn't import it again.
+    """
+    policy = PreviewPolicy(**unit["policy"])
+    clips = unit["clips"]
+    hou.setFrame(1)
+
+    key = (clips[0]["agent_name"], clips[0]["agent_path"], json.dumps(unit["policy"], sort_keys=True))
+    if key not in scaffolds:
+        # Only one agent is kept loaded at a time.
+        for scaffold in scaffolds.values():
+            scaffold.destroy()
+        scaffolds.clear()
+        try:
+            scaffolds[key] = AgentScaffold(hou, clips[0]["agent_name"], clips[0]["agent_path"], policy)
+        except Exception as e:
+            for clip in clips:
+                emit({"status": "failed", "clip": clip, "error": "Could not load agent: {0}".format(e)})
+            return
+    scaffold = scaffolds[key]
+
+    for clip in clips:
+        frames_dir = tempfile.mkdtemp(prefix="thumbnail_")
+        try:
+            start_frame, end_frame, step = scaffold.render(clip, frames_dir)
+        except Exception as e:
+            shutil.rmtree(frames_dir, ignore_errors=True)
+            emit({"status": "failed", "clip": clip, "error": str(e)})
+        else:
+            emit({"status": "rendered", "clip": clip, "frames_dir": frames_dir,
+                  "start_frame": start_frame, "end_frame": end_frame,
+                  "fps": policy.playback_fps(step), "size": policy.size()})
+
+
+def encode_preview(result, preview_format=PreviewFormat):
+    """Encode the frames of a rendered clip into its preview and remove the frames.
+
+    The frames only ever live in the worker's local scratch folder, which is
+    removed in one go once the encoder is done with it.
+    """
+    import ffmpeg
+
+    clip = result["clip"]
+    output = preview_path(clip["clip_path"], preview_format)
+    fps = result["fps"]
+    frames = ffmpeg.input(os.path.join(result["frames_dir"], "frame_%04d.jpeg"), framerate=fps, start_number=0)
+    try:
+        if preview_format == "gif":
+            frames.output(output, vf='split[s0][s1];[s0]palettegen[p];[s1][p]paletteuse',
+                          framerate=fps).run(overwrite_output=True, quiet=True)
+
+        elif preview_format == "webp":
+            frames.output(output, vcodec="libwebp", loop=0, quality=70,
+                          framerate=fps).run(overwrite_output=True, quiet=True)
+
+        elif preview_format == "sprite":
+            # Tile every frame into a grid as square as possible.
+            count = len(os.listdir(result["frames_dir"]))
+            columns = int(math.ceil(math.sqrt(count)))
+            rows = int(math.ceil(count / float(columns)))
+            frames.output(output, vf="tile={0}x{1}".format(columns, rows),
+                          vframes=1).run(overwrite_output=True, quiet=True)
+            with open(os.path.splitext(output)[0] + ".json", "w") as f:
+                json.dump({"frames": count, "columns": columns, "rows": rows,
+                           "width": result["size"][0], "height": result["size"][1], "fps": fps}, f)
+    finally:
+        shutil.rmtree(result["frames_dir"], ignore_errors=True)
+
+
+def import_hou():
+    """Return the hou module, or the fake_hou stand-in when THUMBNAIL_FAKE_HOU is set."""
+    if os.environ.get("THUMBNAIL_FAKE_HOU"):
+        import fake_hou
+        return fake_hou
+    import hou
+    return hou
+
+
+def run_worker(hou, stdin=sys.stdin, stdout=sys.stdout):
+    """Worker loop: render every work unit read from STDIN and report the results on STDOUT."""
+    def emit(result):
+        stdout.write(Marker + json.dumps(result) + "\n")
+        stdout.flush()
+
+    scaffolds = {}
+    for line in stdin:
+        if not line.strip():
+            continue
+        render_unit(hou, json.loads(line), emit, scaffolds)
+        emit({"status": "unit_done"})
+
+
+class ThumbnailFarm():
+    """Render and encode thumbnails for a list of clips across a pool of workers."""
+
+    def __init__(self, workers=Workers, hython=Hython, policy=None, hand_off=None):
+        self.workers = workers
+        self.hython = hython
+        self.policy = policy or PreviewPolicy()
+        # With no workers the clips are rendered with this session's hou module.
+        # If run() is called from a background thread, HAND_OFF must run the hou
+        # side on Houdini's main thread (hdefereval.executeInMainThreadWithResult).
+        self.hand_off = hand_off or (lambda function, *args: function(*args))
+        self.failed = []
+        self.lock = threading.Lock()
+        self.units = []
+        self.priority = set()
+
+    def run(self, clips, progress=None):
+        """Generate the thumbnails of CLIPS and return the list of (clip, error) that failed.
+
+        PROGRESS is called from the calling thread as progress(done, total, clip, error)
+        every time a clip is finished, with ERROR set to None on success.
+        """
+        self.failed = []
+        self.events = queue.Queue()
+        with self.lock:
+            self.units = [{"clips": unit, "policy": asdict(self.policy)}
+                          for unit in split_work(clips, self.workers)]
+
+        # Encoding runs on its own threads so it overlaps with the next render.
+        self.encoder = ThreadPoolExecutor(max_workers=max(self.workers, 1))
+        if self.workers > 0:
+            threads = [threading.Thread(target=self.drive_worker, daemon=True)
+                       for _ in range(min(self.workers, len(self.units)))]
+            for thread in threads:
+                thread.start()
+        else:
+            hou = import_hou()
+            scaffolds = {}
+            unit = self.next_unit()
+            while unit is not None:
+                self.hand_off(render_unit, hou, unit, self.handle_result, scaffolds)
+                unit = self.next_unit()
+            for scaffold in scaffolds.values():
+                self.hand_off(scaffold.destroy)
+
+        # Collect the results here so PROGRESS never runs on a worker thread.
+        for done in range(1, len(clips) + 1):
+            clip, error = self.events.get()
+            if error is not None:
+                self.failed.append((clip, error))
+            if progress:
+                progress(done, len(clips), clip, error)
+
+        self.encoder.shutdown(wait=True)
+        return self.failed
+
+    def next_unit(self):
+        """Take the next work unit to render, starting with the prioritized clips."""
+        with self.lock:
+            for i, unit in enumerate(self.units):
+                urgent = [clip for clip in unit["clips"] if clip["clip_path"] in self.priority]
+                if urgent:
+                    # Split the urgent clips off their unit so they go first.
+                    unit["clips"] = [clip for clip in unit["clips"] if clip["clip_path"] not in self.priority]
+                    if not unit["clips"]:
+                        del self.units[i]
+                    return {"clips": urgent, "policy": unit["policy"]}
+            return self.units.pop(0) if self.units else None
+
+    def prioritize(self, clip_paths):
+        """Render these clips before the rest, e.g. the ones visible in the browser."""
+        with self.lock:
+            self.priority = set(clip_paths)
+
+    def cancel(self):
+        """Drop the work units that haven't started, reporting their clips as cancelled."""
+        with self.lock:
+            units, self.units = self.units, []
+        for unit in units:
+            for clip in unit["clips"]:
+                self.events.put((clip, "Cancelled"))
+
+    def handle_result(self, result):
+        """Queue the encode of a rendered clip, or record the failure."""
+        if result["status"] == "rendered":
+            self.encoder.submit(self.encode, result)
+        elif result["status"] == "failed":
+            self.events.put((result["clip"], result["error"]))
+
+    def encode(self, result):
+        try:
+            encode_preview(result)
+            thumbnail_manifest.record(result["clip"])
+        except Exception as e:
+            self.events.put((result["clip"], str(e)))
+        else:
+            self.events.put((result["clip"], None))
+
+    def drive_worker(self):
+        """Feed work units to one hython process until there are none left."""
+        process = None
+        while True:
+            unit = self.next_unit()
+            if unit is None:
+                break
+
+            pending = {clip["clip_path"]: clip for clip in unit["clips"]}
+            try:
+                if process is None:
+                    process = subprocess.Popen([self.hython, os.path.abspath(__file__)],
+                                               stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                               universal_newlines=True)
+            except OSError as e:
+                # No hython to run the unit: fail its clips so run() isn't left waiting on them.
+                for clip in pending.values():
+                    self.events.put((clip, "Could not start {0}: {1}".format(self.hython, e)))
+                continue
+            try:
+                process.stdin.write(json.dumps(unit) + "\n")
+                process.stdin.flush()
+                for line in process.stdout:
+                    if not line.startswith(Marker):
+                        continue
+                    result = json.loads(line[len(Marker):])
+                    if result["status"] == "unit_done":
+                        break
+                    pending.pop(result["clip"]["clip_path"], None)
+                    self.handle_result(result)
+            except (OSError, ValueError):
+                pass
+
+            # If the worker died mid-unit, fail what is left and start a new one.
+            if pending:
+                process.kill()
+                code = process.wait()
+                for clip in pending.values():
+                    self.events.put((clip, "Worker exited with code {0}".format(code)))
+                process = None
+
+        if process is not None:
+            process.stdin.close()
+            process.wait()
+
+
+if __name__ == "__main__":
+    run_worker(import_hou())
@@ -0,0 +1,68 @@
+"""Sidecar manifest of the clip thumbnails of an agent folder.
+
+Every time a thumbnail is rendered, the size, mtime and (optionally) a
+content hash of its .FBX are recorded in a .thumbnails.json file next to the
+clips. Comparing those against the current .FBX tells whether the thumbnail
+is stale, without having to look at the thumbnail itself.
+"""
+import os, json, hashlib, threading
+
+ManifestName = ".thumbnails.json"
+# Record a hash of the .FBX so a touched but unchanged file isn't rendered again.
+UseHash = True
+# Bytes read at a time when hashing a file.
+HashBlock = 1024 * 1024
+
+_lock = threading.Lock()
+
+
+def file_hash(path):
+    """Hash the whole content of a file. Only done for the clips whose mtime changed."""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HashBlock), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def read_manifest(directory):
+    """Return the manifest of an agent folder as a {clip_name: entry} dictionary."""
+    try:
+        with open(os.path.join(directory, ManifestName), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def record(clip, use_hash=UseHash, digest=None):
+    """Store the state of the .FBX a thumbnail has just been rendered from. DIGEST is its hash, if known."""
+    directory = os.path.dirname(clip["clip_path"])
+    stat = os.stat(clip["clip_path"])
+    entry = {"size": clip.get("size", stat.st_size), "mtime": clip.get("mtime", stat.st_mtime)}
+    if use_hash:
+        entry["hash"] = digest or file_hash(clip["clip_path"])
+
+    # Encodes finish on several threads, so one writer per process at a time.
+    with _lock:
+        manifest = read_manifest(directory)
+        manifest[clip["clip_name"]] = entry
+        path = os.path.join(directory, ManifestName)
+        with open(path + ".tmp", "w") as f:
+            json.dump(manifest, f)
+        os.replace(path + ".tmp", path)
+
+
+def is_stale(clip):
+    """Confirm a clip the catalog flagged as stale really needs a new thumbnail.
+
+    When only the mtime changed and a hash was recorded, the whole .FBX is
+    hashed and if the content is the same the manifest is updated instead.
+    """
+    if (clip["thumbnail_path"] is None or clip.get("rendered_hash") is None
+            or clip["rendered_size"] != clip["size"]):
+        return True
+    digest = file_hash(clip["clip_path"])
+    if digest != clip["rendered_hash"]:
+        return True
+    record(clip, digest=digest)
+    return False
@@ -0,0 +1,518 @@
+"""Builds Variantinator files without the dialog, one or many asset families at a time.
+
+A family is a set of USD files that become the variants of a single file. The
+files of many families are built at the same time, one process per family:
+
+    python variant_builder.py families.json --workers 8
+    python variant_builder.py --families-dir C:/Legacy/Robots --output C:/Assets --mode flat
+    python variant_builder.py --families-dir C:/Legacy/Robots --output C:/Assets --mode payload --proxy
+
+Every file gets a .build.json next to it with the sources it was built from.
+With --update, a file whose sources changed only gets the variants added,
+removed or modified authored again instead of being built from scratch:
+    python variant_builder.py --families-dir C:/Legacy/Robots --output C:/Assets --mode flat --update
+
+Compare the flattened build with the former write/reload/write one:
+    python variant_builder.py --benchmark C:/Legacy/Robots/robots_a
+
+A manifest lists the families:
+    {"families": [{"name": "robots", "output": "C:/Assets/robots.usd", "mode": "flat",
+                   "sources": ["C:/Legacy/robot_a.usd", {"name": "b", "path": "C:/Legacy/robot_b.usd"}]}]}
+With --families-dir, every folder is a family named after it, its USD files are
+the variants and the file is written to the --output folder.
+"""
+import os, sys, json, time, shutil, hashlib, tempfile, argparse, traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from pxr import Usd, UsdGeom, Sdf, Gf, Kind
+import variant_dedup
+
+Modes = ("reference", "flat", "payload")
+# Written next to every file built: the sources and options it was built from.
+ManifestSuffix = ".build.json"
+HashBlock = 1024 * 1024
+SourceExtensions = (".usd", ".usda", ".usdc", ".usdz")
+
+
+@dataclass
+class Family:
+    """Variants to gather in one file: OUTPUT gets a "model" variant per (name, path) of SOURCES."""
+    name: str
+    output: str
+    sources: list = field(default_factory=list)
+    mode: str = "reference"
+    # Store the meshes and materials shared by variants once (flat mode only).
+    dedup: bool = False
+    # Add a bounding box proxy to every variant (payload mode only).
+    proxy: bool = False
+    # Only re-author the variants whose sources changed since the last build.
+    update: bool = False
+
+
+def variant_name(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def build_reference(output, sources):
+    """Author each source as a reference inside a variant of /root."""
+    #Create stage and root prim
+    stage = Usd.Stage.CreateNew(output)
+    root = stage.DefinePrim('/root', 'Xform')
+    #add variant set called model
+    variant_set = root.GetVariantSets().AddVariantSet('model')
+    for name, path in sources:
+        add_reference_variant(stage, variant_set, name, path)
+
+    #Save to file
+    stage.GetRootLayer().Save()
+
+
+def add_reference_variant(stage, variant_set, name, path):
+    #Create a variant with the name provided
+    variant_set.AddVariant(name)
+    variant_set.SetVariantSelection(name)
+
+    #Add reference to geo and mats
+    with variant_set.GetVariantEditContext():
+        stage.GetPrimAtPath('/root').GetReferences().AddReference(path)
+
+
+def build_payload(output, sources, proxy=False):
+    """Author each source as a payload on /root/asset inside a variant of /root, so stages can open it unloaded.
+
+    The payload sits on a child so /root itself stays loaded: every variant
+    gets an extentsHint on /root and, with PROXY, a /root/bbox_proxy box with
+    the proxy purpose, both computed from the source and shown while unloaded.
+    /root is an assembly, as the extentsHint is only read on models. With
+    PROXY the asset gets the render purpose, so the box stands in for it
+    instead of being drawn on top of it once loaded.
+    """
+    #Create stage and root prim
+    stage = Usd.Stage.CreateNew(output)
+    root = stage.DefinePrim('/root', 'Xform')
+    Usd.ModelAPI(root).SetKind(Kind.Tokens.assembly)
+    #add variant set called model
+    variant_set = root.GetVariantSets().AddVariantSet('model')
+    for name, path in sources:
+        add_payload_variant(stage, variant_set, name, path, proxy)
+
+    #Save to file
+    stage.GetRootLayer().Save()
+
+
+def add_payload_variant(stage, variant_set, name, path, proxy):
+    source = Usd.Stage.Open(path)
+    #Name the prim explicitly, a payload alone would need a default prim
+    prim_path = default_prim_path(source.GetRootLayer(), path)
+    bounds = source_bounds(source, prim_path)
+
+    #Create a variant with the name provided
+    variant_set.AddVariant(name)
+    variant_set.SetVariantSelection(name)
+
+    with variant_set.GetVariantEditContext():
+        #Add payload to geo and mats, only loaded on demand
+        asset = stage.DefinePrim('/root/asset')
+        asset.GetPayloads().AddPayload(path, prim_path)
+        if bounds.IsEmpty():
+            return
+        UsdGeom.ModelAPI(stage.GetPrimAtPath('/root')).SetExtentsHint([bounds.GetMin(), bounds.GetMax()])
+        if proxy:
+            box = UsdGeom.Cube.Define(stage, '/root/bbox_proxy')
+            box.CreateSizeAttr(1.0)
+            box.CreatePurposeAttr(UsdGeom.Tokens.proxy)
+            box.AddTranslateOp().Set(Gf.Vec3d(bounds.GetMidpoint()))
+            box.AddScaleOp().Set(Gf.Vec3f(bounds.GetSize()))
+            #The asset is what renders, the box what viewports show in its place
+            imageable = UsdGeom.Imageable(asset)
+            imageable.CreatePurposeAttr(UsdGeom.Tokens.render)
+            imageable.CreateProxyPrimRel().SetTargets([box.GetPath()])
+
+
+def source_bounds(stage, prim_path):
+    """Bounding box of the prim at PRIM_PATH of STAGE, with its own transform, as a Gf.Range3d."""
+    prim = stage.GetPrimAtPath(prim_path)
+    if not prim:
+        return Gf.Range3d()
+    cache = UsdGeom.BBoxCache(Usd.TimeCode.Default(), [UsdGeom.Tokens.default_, UsdGeom.Tokens.render])
+    return cache.ComputeLocalBound(prim).ComputeAlignedRange()
+
+
+def build_flattened(output, sources, dedup=False):
+    """Copy every source into /variants/<name> and switch between them with a variant set on /root.
+
+    The file is put together in memory and written once: each source is
+    flattened on its own, copied under /variants and dropped before the next.
+    With DEDUP, meshes and materials shared by variants are stored once (see
+    variant_dedup) and the stats are returned.
+    """
+    layer = Sdf.Layer.CreateAnonymous()
+    root = Sdf.CreatePrimInLayer(layer, '/root')
+    root.specifier = Sdf.SpecifierDef
+    root.typeName = 'Xform'
+
+    #Define the container for all the files
+    variants = Sdf.CreatePrimInLayer(layer, '/variants')
+    variants.specifier = Sdf.SpecifierDef
+    variants.typeName = 'Xform'
+
+    for name, path in sources:
+        copy_source(layer, name, path)
+
+    stats = variant_dedup.deduplicate(layer) if dedup else None
+
+    #add variant set called model
+    variant_set = Sdf.VariantSetSpec(root, 'model')
+    for name, path in sources:
+        add_flat_variant(variant_set, name)
+    root.variantSetNameList.Append('model')
+    if sources:
+        root.variantSelections['model'] = sources[-1][0]
+
+    #Save to file
+    layer.Export(output)
+    return stats
+
+
+def copy_source(layer, name, path):
+    #Copy the default prim of the file, like a reference would, to '/variants/variant_name'
+    flattened = Usd.Stage.Open(path).Flatten()
+    source_path = default_prim_path(flattened, path)
+    target_path = Sdf.Path('/variants').AppendChild(name)
+    #Paths inside the prim (bindings, connections) are moved along with it
+    Sdf.CopySpec(flattened, source_path, layer, target_path)
+    #make them invisible so they don't appear at first glance
+    set_visibility(layer.GetPrimAtPath(target_path), UsdGeom.Tokens.invisible)
+
+
+def add_flat_variant(variant_set, name):
+    #Geo and mats are already in the file, so we use an internal reference and make them visible
+    variant = Sdf.VariantSpec(variant_set, name)
+    variant.primSpec.referenceList.Append(Sdf.Reference('', Sdf.Path('/variants').AppendChild(name)))
+    set_visibility(variant.primSpec, UsdGeom.Tokens.visible)
+
+
+def default_prim_path(layer, path):
+    """Path of the prim a reference to the file would bring in: the default prim, or the first one."""
+    if layer.defaultPrim:
+        return Sdf.Path.absoluteRootPath.AppendChild(layer.defaultPrim)
+    if not layer.rootPrims:
+        raise ValueError("{0} has no prims".format(path))
+    return layer.rootPrims[0].path
+
+
+def set_visibility(prim_spec, value):
+    attribute = prim_spec.attributes.get(UsdGeom.Tokens.visibility)
+    if attribute is None:
+        attribute = Sdf.AttributeSpec(prim_spec, UsdGeom.Tokens.visibility, Sdf.ValueTypeNames.Token)
+    attribute.default = value
+
+
+def build_flattened_roundtrip(output, sources):
+    """The former flattened build (write, read back, write again), kept to compare against."""
+    stage = Usd.Stage.CreateNew(output)
+    root = stage.DefinePrim('/root', 'Xform')
+    stage.DefinePrim('/variants', 'Xform')
+    for name, path in sources:
+        current_prim = stage.DefinePrim(f'/variants/{name}', 'Xform')
+        current_prim.GetReferences().AddReference(path)
+        current_prim.GetAttribute('visibility').Set(UsdGeom.Tokens.invisible)
+    stage.Export(output)
+    stage.Reload()
+
+    root = stage.GetPrimAtPath('/root')
+    variant_set = root.GetVariantSets().AddVariantSet('model')
+    for name, path in sources:
+        variant_set.AddVariant(name)
+        variant_set.SetVariantSelection(name)
+        with variant_set.GetVariantEditContext():
+            root.GetPrim().GetReferences().AddInternalReference(f'/variants/{name}')
+            root.GetPrim().GetAttribute('visibility').Set(UsdGeom.Tokens.visible)
+    stage.GetRootLayer().Save()
+
+
+def manifest_path(output):
+    return output + ManifestSuffix
+
+
+def file_hash(path):
+    """Hash of the whole content of a file."""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HashBlock), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def source_record(name, path, old=None):
+    """What is remembered of a source to tell later whether it changed.
+
+    The hash of OLD, the record of the last build, is kept when the file looks the same.
+    """
+    stat = os.stat(path)
+    record = {"name": name, "path": path, "size": stat.st_size, "mtime": stat.st_mtime}
+    if old and (old["path"], old["size"], old["mtime"]) == (path, stat.st_size, stat.st_mtime):
+        record["hash"] = old["hash"]
+    else:
+        record["hash"] = file_hash(path)
+    return record
+
+
+def write_manifest(family, records):
+    manifest = {"mode": family.mode, "dedup": family.dedup, "proxy": family.proxy, "sources": records}
+    with open(manifest_path(family.output) + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=4)
+    os.replace(manifest_path(family.output) + ".tmp", manifest_path(family.output))
+
+
+def read_manifest(output):
+    """The build manifest written next to OUTPUT, or None."""
+    try:
+        with open(manifest_path(output), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def changes(manifest, records):
+    """Names of the variants (added, removed, moved, modified) between MANIFEST and the source RECORDS.
+
+    Moved sources have a new path, modified ones also count the moved ones.
+    """
+    built = dict((s["name"], s) for s in manifest["sources"])
+    wanted = dict((r["name"], r) for r in records)
+    added = [name for name in wanted if name not in built]
+    removed = [name for name in built if name not in wanted]
+    moved = [name for name in wanted if name in built and built[name]["path"] != wanted[name]["path"]]
+    modified = [name for name in wanted if name in built and
+                (name in moved or built[name]["hash"] != wanted[name]["hash"])]
+    return added, removed, moved, modified
+
+
+def update(family, manifest, records):
+    """Re-author only the variants whose sources were added, removed or modified since MANIFEST.
+
+    Returns {"added", "removed", "modified"} names, or None when the file has
+    to be built from scratch instead.
+    """
+    if (manifest["mode"], manifest.get("dedup"), manifest.get("proxy")) != (family.mode, family.dedup, family.proxy):
+        return None
+    added, removed, moved, modified = changes(manifest, records)
+    if family.mode == "flat" and family.dedup and (added or removed or modified):
+        # The prototypes are shared between variants, they are worked out again from scratch.
+        return None
+    # A reference is read again when the stage is opened, only a new path changes the file.
+    redo = moved if family.mode == "reference" else modified
+    sources = dict(family.sources)
+
+    layer = Sdf.Layer.FindOrOpen(family.output)
+    root = layer.GetPrimAtPath('/root') if layer else None
+    if root is None or 'model' not in root.variantSets:
+        return None
+    variant_set_spec = root.variantSets['model']
+    selection = root.variantSelections.get('model')
+    for name in removed + redo:
+        variant_set_spec.RemoveVariant(variant_set_spec.variants[name])
+        if family.mode == "flat":
+            del layer.GetPrimAtPath('/variants').nameChildren[name]
+
+    if family.mode == "flat":
+        for name in redo + added:
+            copy_source(layer, name, sources[name])
+            add_flat_variant(variant_set_spec, name)
+    else:
+        stage = Usd.Stage.Open(layer)
+        variant_set = stage.GetPrimAtPath('/root').GetVariantSet('model')
+        for name in redo + added:
+            if family.mode == "payload":
+                add_payload_variant(stage, variant_set, name, sources[name], family.proxy)
+            else:
+                add_reference_variant(stage, variant_set, name, sources[name])
+
+    #Keep the selection, unless its variant was removed
+    if selection in sources:
+        root.variantSelections['model'] = selection
+    elif family.sources:
+        root.variantSelections['model'] = family.sources[-1][0]
+    if added or removed or redo:
+        layer.Save()
+    return {"added": added, "removed": removed, "modified": modified}
+
+
+def build(family):
+    """Build one family. Returns a report: name, output, seconds and error (None if it worked).
+
+    With family.update and a build manifest next to the output, only the
+    variants that changed are authored again, listed in the report's "changes".
+    """
+    start = time.time()
+    error = None
+    stats = None
+    updated = None
+    try:
+        if family.mode not in Modes:
+            raise ValueError("Unknown mode {0}, use one of {1}".format(family.mode, ", ".join(Modes)))
+        if not family.sources:
+            raise ValueError("No source files")
+        missing = [path for name, path in family.sources if not os.path.exists(path)]
+        if missing:
+            raise IOError("Missing source files: " + ", ".join(missing))
+        if os.path.dirname(family.output) and not os.path.isdir(os.path.dirname(family.output)):
+            os.makedirs(os.path.dirname(family.output))
+        manifest = read_manifest(family.output) if family.update and os.path.exists(family.output) else None
+        built = dict((s["name"], s) for s in manifest["sources"]) if manifest else {}
+        records = [source_record(name, path, built.get(name)) for name, path in family.sources]
+        if manifest:
+            updated = update(family, manifest, records)
+        if updated is None:
+            if family.mode == "flat":
+                stats = build_flattened(family.output, family.sources, family.dedup)
+            elif family.mode == "payload":
+                build_payload(family.output, family.sources, family.proxy)
+            else:
+                build_reference(family.output, family.sources)
+        write_manifest(family, records)
+    except Exception:
+        # One broken family must not stop the batch, it is reported instead.
+        error = traceback.format_exc()
+    return {"name": family.name, "output": family.output, "variants": len(family.sources),
+            "seconds": time.time() - start, "error": error, "dedup": stats, "changes": updated}
+
+
+def build_all(families, workers=None, progress=None):
+    """Build FAMILIES in a pool of WORKERS processes. PROGRESS, if given, gets each report as it comes."""
+    reports = []
+    if workers == 0:
+        # In this process, one after the other.
+        for family in families:
+            reports.append(build(family))
+            if progress:
+                progress(reports[-1])
+        return reports
+
+    with ProcessPoolExecutor(workers) as pool:
+        futures = [pool.submit(build, family) for family in families]
+        for future in as_completed(futures):
+            reports.append(future.result())
+            if progress:
+                progress(reports[-1])
+    return reports
+
+
+def load_manifest(path):
+    """Read the families of a JSON manifest. Relative paths are relative to the manifest."""
+    with open(path, "r") as f:
+        manifest = json.load(f)
+    base = os.path.dirname(os.path.abspath(path))
+    families = []
+    for entry in manifest["families"]:
+        sources = []
+        for source in entry["sources"]:
+            if isinstance(source, str):
+                source = {"path": source}
+            source_path = os.path.join(base, source["path"])
+            sources.append((source.get("name") or variant_name(source_path), source_path))
+        output = os.path.join(base, entry["output"])
+        families.append(Family(entry.get("name") or variant_name(output), output, sources,
+                               entry.get("mode", "reference"), entry.get("dedup", False),
+                               entry.get("proxy", False)))
+    return families
+
+
+def families_from_directory(directory, output_dir, mode="reference", extension=".usd", dedup=False, proxy=False,
+                            update=False):
+    """One family per folder of DIRECTORY, with its USD files as variants, written to OUTPUT_DIR."""
+    families = []
+    for entry in sorted(os.scandir(directory), key=lambda e: e.name):
+        if not entry.is_dir():
+            continue
+        sources = [(variant_name(f.path), os.path.abspath(f.path).replace("\\", "/"))
+                   for f in sorted(os.scandir(entry.path), key=lambda e: e.name)
+                   if f.is_file() and f.name.endswith(SourceExtensions)]
+        if sources:
+            output = os.path.join(output_dir, entry.name + extension).replace("\\", "/")
+            families.append(Family(entry.name, output, sources, mode, dedup, proxy, update))
+    return families
+
+
+def _measure(builder, output, sources):
+    # Runs in a fresh process, so the peak memory is this build's alone.
+    start = time.time()
+    globals()[builder](output, sources)
+    seconds = time.time() - start
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Kilobytes on Linux, bytes on macOS.
+        peak = peak / 1e6 if sys.platform == "darwin" else peak / 1e3
+    except ImportError:
+        peak = None
+    return seconds, peak
+
+
+def benchmark(directory, extension=".usdc", runs=3):
+    """Compare the single pass flattened build with the former one on the USD files of DIRECTORY."""
+    sources = [(variant_name(f.path), f.path) for f in sorted(os.scandir(directory), key=lambda e: e.name)
+               if f.is_file() and f.name.endswith(SourceExtensions)]
+    print("{0} source files, {1:.1f} MB".format(len(sources), sum(os.path.getsize(p) for n, p in sources) / 1e6))
+    scratch = tempfile.mkdtemp(prefix="variant_benchmark_")
+    try:
+        for builder in ("build_flattened_roundtrip", "build_flattened"):
+            output = os.path.join(scratch, builder + extension)
+            results = []
+            for run in range(runs):
+                with ProcessPoolExecutor(1) as pool:
+                    results.append(pool.submit(_measure, builder, output, sources).result())
+            seconds = sorted(r[0] for r in results)[runs // 2]
+            peak = max(r[1] for r in results) if results[0][1] is not None else None
+            print("{0:26} {1:8.2f} s   peak memory {2}   file {3:.1f} MB".format(
+                builder, seconds, "{0:.0f} MB".format(peak) if peak else "n/a", os.path.getsize(output) / 1e6))
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+def print_report(report):
+    status = "FAILED" if report["error"] else "ok"
+    print("{0:40} {1:4} variants {2:8.2f} s  {3}".format(report["name"], report["variants"], report["seconds"], status))
+    if report["dedup"]:
+        print("    {0} shared prims stored once as {1} prototypes, {2:.1f} MB of values saved".format(
+            report["dedup"]["deduplicated"], report["dedup"]["prototypes"], report["dedup"]["bytes_saved"] / 1e6))
+    if report["changes"]:
+        print("    updated: {0} added, {1} removed, {2} modified".format(
+            *[len(report["changes"][key]) for key in ("added", "removed", "modified")]))
+    if report["error"]:
+        print("    " + report["error"].strip().replace("\n", "\n    "))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build Variantinator files for many asset families at once.")
+    parser.add_argument("manifest", nargs="?", help="JSON manifest of the families")
+    parser.add_argument("--families-dir", help="Folder with one sub folder of USD files per family")
+    parser.add_argument("--output", help="Where the --families-dir files are written")
+    parser.add_argument("--mode", choices=Modes, default="reference")
+    parser.add_argument("--format", default=".usd", choices=(".usd", ".usda", ".usdc"))
+    parser.add_argument("--dedup", action="store_true", help="Store meshes and materials shared by variants once (flat mode)")
+    parser.add_argument("--proxy", action="store_true", help="Add a bounding box proxy to every variant (payload mode)")
+    parser.add_argument("--update", action="store_true", help="Only re-author the variants whose sources changed")
+    parser.add_argument("--workers", type=int, default=None, help="Processes to use, 0 builds in this one")
+    parser.add_argument("--benchmark", metavar="DIR", help="Time the flattened builds on the USD files of DIR")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.benchmark, args.format)
+        sys.exit(0)
+    if args.manifest:
+        families = load_manifest(args.manifest)
+        for family in families:
+            family.update = args.update
+    elif args.families_dir and args.output:
+        families = families_from_directory(args.families_dir, args.output, args.mode, args.format, args.dedup, args.proxy,
+                                           args.update)
+    else:
+        parser.error("give a manifest, or --families-dir and --output")
+
+    start = time.time()
+    reports = build_all(families, args.workers, print_report)
+    failed = [r for r in reports if r["error"]]
+    print("{0} families built in {1:.2f} s, {2} failed".format(len(reports) - len(failed), time.time() - start, len(failed)))
+    sys.exit(1 if failed else 0)
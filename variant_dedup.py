@@ -0,0 +1,189 @@
+"""Stores the meshes and materials shared by several variants of a flattened file only once.
+
+Variants of a theme often share parts: the same hands, bolts or metal on 30
+robots. Once the variants are copied under /variants, every Mesh and
+Material is hashed (its attributes, values and children, but not where it
+sits or how it is placed). Each one found more than once is moved to
+/prototypes and every copy becomes an internal reference to it. The
+transform, visibility and material bindings of each copy stay on the copy:
+a binding must point inside /variants/<name>, or it is dropped once /root is
+referenced into another stage.
+"""
+import hashlib
+from pxr import Sdf, UsdGeom
+
+# Prim types that are deduplicated. Materials go first, so meshes bound to
+# the same material in different variants end up bound to the same prototype.
+Kinds = [("Material", "materials"), ("Mesh", "meshes")]
+# Opinions that stay on each copy instead of being part of the prototype.
+LocalProperties = ("visibility", "purpose", "xformOpOrder")
+LocalPrefixes = ("xformOp:",)
+# Relationships kept on every copy, at any depth, so they target the copy's own material.
+BindingPrefix = "material:binding"
+
+
+def is_local(name):
+    return name in LocalProperties or name.startswith(LocalPrefixes)
+
+
+def is_binding(name):
+    return name.startswith(BindingPrefix)
+
+
+def _relative(path, root, moved):
+    """Paths inside the hashed prim are written relative to it, so copies hash the same.
+
+    Paths to a deduplicated prim are written as its prototype, so meshes bound
+    to copies of the same material hash the same too.
+    """
+    if path.HasPrefix(root):
+        return "." + str(path)[len(str(root)):]
+    for old, new in moved.items():
+        if path.HasPrefix(old):
+            return str(path.ReplacePrefix(old, new))
+    return str(path)
+
+
+def _hash_value(h, value):
+    try:
+        data = memoryview(value)
+        h.update(data.cast("B"))
+        return data.nbytes
+    except (TypeError, ValueError):
+        text = str(value).encode("utf-8")
+        h.update(text)
+        return len(text)
+
+
+def _hash_spec(h, layer, spec, root, top, moved):
+    """Hash a prim spec and its children. Returns the bytes of values it holds."""
+    size = 0
+    h.update(spec.typeName.encode("utf-8"))
+    for key in sorted(spec.ListInfoKeys()):
+        if key not in ("specifier", "primOrder", "propertyOrder"):
+            h.update(key.encode("utf-8") + str(spec.GetInfo(key)).encode("utf-8"))
+
+    for name in sorted(spec.properties.keys()):
+        if top and is_local(name):
+            continue
+        prop = spec.properties[name]
+        h.update(name.encode("utf-8"))
+        if isinstance(prop, Sdf.AttributeSpec):
+            h.update(str(prop.typeName).encode("utf-8"))
+            if prop.HasDefaultValue():
+                size += _hash_value(h, prop.default)
+            for time in layer.ListTimeSamplesForPath(prop.path):
+                h.update(str(time).encode("utf-8"))
+                size += _hash_value(h, layer.QueryTimeSample(prop.path, time))
+            targets = prop.connectionPathList.GetAddedOrExplicitItems()
+        else:
+            targets = prop.targetPathList.GetAddedOrExplicitItems()
+        for target in targets:
+            h.update(_relative(target, root, moved).encode("utf-8"))
+
+    for child in spec.nameChildren:
+        h.update(b"/" + child.name.encode("utf-8"))
+        size += _hash_spec(h, layer, child, root, False, moved)
+    return size
+
+
+def fingerprint(layer, spec, moved=None):
+    """(hash, bytes of values) of a prim spec, ignoring its name, place and local opinions.
+
+    MOVED maps the deduplicated prims to their prototype, see _relative().
+    """
+    h = hashlib.blake2b(digest_size=16)
+    size = _hash_spec(h, layer, spec, spec.path, True, moved or {})
+    return h.hexdigest(), size
+
+
+def find(spec, type_name):
+    """Prim specs of TYPE_NAME under SPEC, not looking inside the ones found."""
+    found = []
+    for child in spec.nameChildren:
+        if child.typeName == type_name:
+            found.append(child)
+        else:
+            found += find(child, type_name)
+    return found
+
+
+def strip_bindings(spec):
+    """Remove the material bindings of a prototype and its children, the copies keep them."""
+    for name in list(spec.properties.keys()):
+        if is_binding(name):
+            spec.RemoveProperty(spec.properties[name])
+    for child in spec.nameChildren:
+        strip_bindings(child)
+
+
+def keep_local(spec, top):
+    """Strip a copy down to what stays on it: local opinions and bindings. Returns False once it is empty."""
+    for name in list(spec.properties.keys()):
+        if not (is_binding(name) or (top and is_local(name))):
+            spec.RemoveProperty(spec.properties[name])
+    for child in list(spec.nameChildren):
+        if not keep_local(child, False):
+            del spec.nameChildren[child.name]
+    if not top:
+        #Only an opinion over what the prototype brings in
+        spec.specifier = Sdf.SpecifierOver
+        spec.typeName = ""
+    return bool(spec.properties) or bool(spec.nameChildren)
+
+
+def deduplicate(layer, variants_path="/variants", prototypes_path="/prototypes"):
+    """Move the meshes and materials found more than once under VARIANTS_PATH to PROTOTYPES_PATH.
+
+    Returns {"prototypes", "deduplicated", "bytes_saved"}: the prims moved,
+    the copies they replace and the bytes of values no longer stored twice.
+    """
+    stats = {"prototypes": 0, "deduplicated": 0, "bytes_saved": 0}
+    variants = layer.GetPrimAtPath(variants_path)
+    if variants is None:
+        return stats
+
+    prototypes = None
+    # Copy -> prototype of every prim deduplicated so far.
+    moved = {}
+    for type_name, scope_name in Kinds:
+        groups = {}
+        for spec in find(variants, type_name):
+            digest, size = fingerprint(layer, spec, moved)
+            groups.setdefault(digest, [size, []])[1].append(spec.path)
+
+        for digest, (size, paths) in sorted(groups.items()):
+            if len(paths) < 2:
+                continue
+            if prototypes is None:
+                prototypes = Sdf.CreatePrimInLayer(layer, prototypes_path)
+                prototypes.specifier = Sdf.SpecifierDef
+                prototypes.typeName = "Scope"
+                #The prototypes are only seen through the variants
+                attribute = Sdf.AttributeSpec(prototypes, UsdGeom.Tokens.visibility, Sdf.ValueTypeNames.Token)
+                attribute.default = UsdGeom.Tokens.invisible
+            scope = layer.GetPrimAtPath(prototypes_path + "/" + scope_name)
+            if scope is None:
+                scope = Sdf.CreatePrimInLayer(layer, prototypes_path + "/" + scope_name)
+                scope.specifier = Sdf.SpecifierDef
+                scope.typeName = "Scope"
+
+            prototype_path = scope.path.AppendChild("{0}_{1}".format(paths[0].name, digest[:8]))
+            Sdf.CopySpec(layer, paths[0], layer, prototype_path)
+            prototype = layer.GetPrimAtPath(prototype_path)
+            for name in list(prototype.properties.keys()):
+                if is_local(name):
+                    prototype.RemoveProperty(prototype.properties[name])
+            strip_bindings(prototype)
+
+            #Every copy keeps only its local opinions and bindings, and references the prototype
+            for path in paths:
+                spec = layer.GetPrimAtPath(path)
+                keep_local(spec, True)
+                spec.referenceList.Prepend(Sdf.Reference("", prototype_path))
+                moved[path] = prototype_path
+
+            stats["prototypes"] += 1
+            stats["deduplicated"] += len(paths)
+            stats["bytes_saved"] += size * (len(paths) - 1)
+    return stats
@@ -1,6 +1,6 @@
 from PySide2 import QtWidgets, QtCore, QtGui
-from pxr import Usd, UsdGeom
 import os
+import variant_builder
 
 
 class QHLine(QtWidgets.QFrame):
@@ -108,6 +108,14 @@ class LoadFileApp(QtWidgets.QWidget):
         self.buttonBuildRef.clicked.connect(self.builtVariantsFileRef)
         self.buttonBuildFlat = QtWidgets.QPushButton("Build Flattened File")
         self.buttonBuildFlat.clicked.connect(self.builtVariantsFileFlat)
+        self.dedupCheckBox = QtWidgets.QCheckBox("Share Duplicates")
+        self.dedupCheckBox.setToolTip("Flattened file: store meshes and materials found in several variants only once")
+        self.buttonBuildPayload = QtWidgets.QPushButton("Build Payload File")
+        self.buttonBuildPayload.clicked.connect(self.builtVariantsFilePayload)
+        self.proxyCheckBox = QtWidgets.QCheckBox("Bounding Box Proxies")
+        self.proxyCheckBox.setToolTip("Payload file: add a box with the proxy purpose to every variant")
+        self.updateCheckBox = QtWidgets.QCheckBox("Update Existing")
+        self.updateCheckBox.setToolTip("Only re-author the variants whose files were added, removed or changed since the last build")
         
         self.buildHLayout = QtWidgets.QHBoxLayout()
         self.buildHLayout.addWidget(self.buttonBrowse)
@@ -117,6 +125,10 @@ class LoadFileApp(QtWidgets.QWidget):
         self.buildButtonsHLayout = QtWidgets.QHBoxLayout()
         self.buildButtonsHLayout.addWidget(self.buttonBuildRef)
         self.buildButtonsHLayout.addWidget(self.buttonBuildFlat)
+        self.buildButtonsHLayout.addWidget(self.dedupCheckBox)
+        self.buildButtonsHLayout.addWidget(self.buttonBuildPayload)
+        self.buildButtonsHLayout.addWidget(self.proxyCheckBox)
+        self.buildButtonsHLayout.addWidget(self.updateCheckBox)
         
         #self.flattenCheckBox = QtWidgets.QCheckBox("Flatten")
         self.filePathVLayout = QtWidgets.QVBoxLayout()
@@ -190,65 +202,37 @@ class LoadFileApp(QtWidgets.QWidget):
         self.fillLists(names[0])
 
 
+    def sources(self):
+        #(variant name, file path) of every dropped file
+        return [(self.variantsList.item(x).text(), self.filePathsList.item(x).text()) for x in range(self.filePathsList.count())]
+
+    def buildFile(self, mode):
+        output = self.textboxPath.text() + self.formatOptions.currentText()
+        family = variant_builder.Family(os.path.basename(self.textboxPath.text()), output, self.sources(), mode,
+                                        self.dedupCheckBox.isChecked(), self.proxyCheckBox.isChecked(),
+                                        self.updateCheckBox.isChecked())
+        #Also writes the build manifest used by Update Existing
+        report = variant_builder.build(family)
+        if(report["error"]):
+            QtWidgets.QMessageBox.warning(self, "Variantinator", report["error"])
+        elif(report["changes"]):
+            QtWidgets.QMessageBox.information(self, "Variantinator",
+                "{0} variants added, {1} removed, {2} modified".format(
+                    *[len(report["changes"][key]) for key in ("added", "removed", "modified")]))
+        elif(report["dedup"]):
+            stats = report["dedup"]
+            QtWidgets.QMessageBox.information(self, "Variantinator",
+                "{0} shared prims stored once as {1} prototypes, {2:.1f} MB of values saved".format(
+                    stats["deduplicated"], stats["prototypes"], stats["bytes_saved"] / 1e6))
+
     def builtVariantsFileRef(self):
-        #Create stage and root prim
-        stage = Usd.Stage.CreateNew(self.textboxPath.text() + self.formatOptions.currentText())
-        root = stage.DefinePrim('/root', 'Xform')
-        #add variant set called model
-        variant_set = root.GetVariantSets().AddVariantSet('model')
-        for x in range(self.filePathsList.count()):
-            #Create a variant with the name provided
-            variant_name = self.variantsList.item(x).text()
-            variant_set.AddVariant(variant_name)
-            variant_set.SetVariantSelection(variant_name)
-
-            #Add reference to geo and mats
-            with variant_set.GetVariantEditContext():
-                root.GetPrim().GetReferences().AddReference(self.filePathsList.item(x).text())
-        
-        #Save to file
-        stage.GetRootLayer().Save()
+        self.buildFile("reference")
 
     def builtVariantsFileFlat(self):
-        #Create stage and root prim
-        stage = Usd.Stage.CreateNew(self.textboxPath.text() + self.formatOptions.currentText())
-        root = stage.DefinePrim('/root', 'Xform')
-
-        #Define the container for all the files
-        stage.DefinePrim('/variants', 'Xform')
-
-        #import each file as a reference
-        for x in range(self.filePathsList.count()):
-            #import file to '/variants/varian_name' but if you want them any other place, just change this paht
-            current_prim = stage.DefinePrim(f'/variants/{self.variantsList.item(x).text()}', 'Xform')
-            current_prim.GetReferences().AddReference(self.filePathsList.item(x).text())
-            #make them invisible so they don't appear at first glance
-            current_prim.GetAttribute('visibility').Set(UsdGeom.Tokens.invisible)
-        
-        #export flattened layer
-        stage.Export(self.textboxPath.text() + self.formatOptions.currentText())
-        
-        #reimport file
-        stage.Reload()
+        self.buildFile("flat")
 
-        #get root, if file was not flattened, it should be empty
-        root = stage.GetPrimAtPath('/root')
-        #add variant set called model
-        variant_set = root.GetVariantSets().AddVariantSet('model')
-        for x in range(self.filePathsList.count()):
-            #Create a variant with the name provided
-            variant_name = self.variantsList.item(x).text()
-            variant_set.AddVariant(variant_name)
-            variant_set.SetVariantSelection(variant_name)
-
-            #Add reference to geo and mats
-            with variant_set.GetVariantEditContext():
-                #If flattened, geo and mats are already in the file, so we use an internal reference and make them visible
-                root.GetPrim().GetReferences().AddInternalReference(f'/variants/{self.variantsList.item(x).text()}')
-                root.GetPrim().GetAttribute('visibility').Set(UsdGeom.Tokens.visible)
-        
-        #Save to file
-        stage.GetRootLayer().Save()
+    def builtVariantsFilePayload(self):
+        self.buildFile("payload")
 
 #Run app
 app = LoadFileApp()
@@ -0,0 +1,135 @@
+"""Index of the versioned .hip files of a directory, shared by the Load and Save dialogs.
+
+Files are named <name>_v<version>.hip. A directory is parsed once into a
+{name: sorted versions} dictionary and kept in memory; it is only looked at
+again when its mtime changes, and then only the added or removed files are
+parsed.
+"""
+import os, re, bisect
+import hip_store
+
+Extension = ".hip"
+
+_versioned = re.compile(r"^(.*)_v(\d+)$")
+# Directory -> VersionIndex, for every directory looked at in this session.
+_indexes = {}
+
+
+def parse(filename):
+    """Split "shot_v003.hip" into ("shot", 3, "003"). Files with no version give ("shot", None, None)."""
+    name = os.path.splitext(os.path.basename(filename))[0]
+    match = _versioned.match(name)
+    if match:
+        return match.group(1), int(match.group(2)), match.group(2)
+    return name, None, None
+
+
+class VersionIndex():
+    """Names and versions of the .hip files of one directory."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.mtime = None
+        self.files = set()
+        # Bumped on every add or remove, so watchers can tell the list changed.
+        self.generation = 0
+        # Name -> sorted list of (version number, version text).
+        self.versions = {}
+        # Name -> version numbers being saved, not on disk yet.
+        self.reserved = {}
+
+    def refresh(self):
+        """Parse the files added or removed since the last refresh, if the directory changed.
+
+        Versions kept in the deduplicated store (see hip_store) are listed too.
+        """
+        manifests = os.path.join(hip_store.store_path(self.directory), "manifests")
+        mtime = (os.stat(self.directory).st_mtime,
+                 os.stat(manifests).st_mtime if os.path.isdir(manifests) else None)
+        if mtime == self.mtime:
+            return
+        self.mtime = mtime
+        files = set(f for f in os.listdir(self.directory) if f.endswith(Extension))
+        files.update(f for f in hip_store.versions(self.directory) if f.endswith(Extension))
+        for filename in self.files - files:
+            self.remove(filename)
+        for filename in files - self.files:
+            self.add(filename)
+
+    def add(self, filename):
+        filename = os.path.basename(filename)
+        if filename in self.files:
+            return
+        self.files.add(filename)
+        self.generation += 1
+        name, number, text = parse(filename)
+        versions = self.versions.setdefault(name, [])
+        if number is not None:
+            bisect.insort(versions, (number, text))
+
+    def remove(self, filename):
+        filename = os.path.basename(filename)
+        if filename not in self.files:
+            return
+        self.files.discard(filename)
+        self.generation += 1
+        name, number, text = parse(filename)
+        versions = self.versions.get(name, [])
+        if number is not None and (number, text) in versions:
+            versions.remove((number, text))
+        # Forget the name once none of its files are left.
+        if not versions and name + Extension not in self.files:
+            self.versions.pop(name, None)
+
+    def names(self):
+        """Sorted names of the files, without version or extension."""
+        return sorted(self.versions)
+
+    def all_versions(self, name):
+        """Version texts of NAME, oldest first: ["001", "002", ...]."""
+        return [text for number, text in self.versions.get(name, [])]
+
+    def latest(self, name):
+        """Latest version text of NAME, or None if it has no versions."""
+        versions = self.versions.get(name)
+        return versions[-1][1] if versions else None
+
+    def next_version(self, name):
+        """Number of the next version to save for NAME."""
+        versions = self.versions.get(name)
+        latest = versions[-1][0] if versions else 0
+        return max([latest] + list(self.reserved.get(name, ()))) + 1
+
+    def reserve(self, filename):
+        """Keep the version of FILENAME from being handed out again while it is being saved."""
+        name, number, text = parse(filename)
+        if number is not None:
+            self.reserved.setdefault(name, set()).add(number)
+            self.generation += 1
+
+    def release(self, filename):
+        """Forget the reservation of FILENAME, once it is saved (see add) or failed to save."""
+        name, number, text = parse(filename)
+        numbers = self.reserved.get(name)
+        if numbers and number in numbers:
+            numbers.discard(number)
+            if not numbers:
+                del self.reserved[name]
+            self.generation += 1
+
+    def path(self, name, version=None):
+        """Path of a version of NAME, or of the file with no version if VERSION is empty."""
+        filename = name + "_v" + version + Extension if version else name + Extension
+        return os.path.join(self.directory, filename).replace('\\', '/')
+
+
+def get_index(directory):
+    """Return the up to date VersionIndex of DIRECTORY, or None if it doesn't exist."""
+    if not os.path.isdir(directory):
+        return None
+    key = os.path.normcase(os.path.abspath(directory))
+    index = _indexes.get(key)
+    if index is None:
+        index = _indexes[key] = VersionIndex(directory)
+    index.refresh()
+    return index
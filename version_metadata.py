@@ -0,0 +1,80 @@
+"""Scene stats recorded for every version at save time, shown by the Load dialog.
+
+Each version gets a small record in the "metadata" journal store of its folder
+(metadata.json / metadata.journal, see journal_store) and a viewport snapshot
+in .snapshots/<name>_v<version>.jpg, so picking a version never needs loading it.
+"""
+import os, shutil, getpass
+import hou
+from journal_store import get_store
+
+SnapshotDir = ".snapshots"
+SnapshotSize = (320, 180)
+
+
+def metadata_store(directory):
+    """The store of the version metadata of a directory (metadata.json)."""
+    return get_store(directory, "metadata")
+
+
+def snapshot_path(directory, key):
+    return os.path.join(directory, SnapshotDir, key + ".jpg").replace('\\', '/')
+
+
+def capture(hipPath, saveDuration):
+    """Stats of the current scene, just saved at HIPPATH in SAVEDURATION seconds."""
+    start, end = hou.playbar.frameRange()
+    return {
+        "size": os.path.getsize(hipPath),
+        "nodes": len(hou.node("/").allSubChildren()),
+        "save_duration": round(saveDuration, 2),
+        "frame_range": [start, end],
+        "author": getpass.getuser(),
+        "houdini": hou.applicationVersionString(),
+    }
+
+
+def snapshot(path):
+    """Flipbook the current frame of the viewport to a small .jpg at PATH. Returns PATH, or None without a viewport.
+
+    Saves write it next to the local scene, see publish_snapshot().
+    """
+    viewer = hou.ui.paneTabOfType(hou.paneTabType.SceneViewer) if hou.isUIAvailable() else None
+    if(viewer is None):
+        return None
+    if(not os.path.exists(os.path.dirname(path))):
+        os.makedirs(os.path.dirname(path))
+
+    settings = viewer.flipbookSettings().stash()
+    frame = hou.frame()
+    settings.frameRange((frame, frame))
+    settings.output(path)
+    settings.useResolution(True)
+    settings.resolution(SnapshotSize)
+    settings.outputToMPlay(False)
+    try:
+        viewer.flipbook(viewer.curViewport(), settings)
+    except hou.Error:
+        return None
+    return path if os.path.exists(path) else None
+
+
+def publish_snapshot(localPath, directory, key):
+    """Move a snapshot taken with snapshot() to the .snapshots of DIRECTORY, once its version landed."""
+    if(localPath is None or not os.path.exists(localPath)):
+        return None
+    path = snapshot_path(directory, key)
+    if(not os.path.exists(os.path.dirname(path))):
+        os.makedirs(os.path.dirname(path))
+    shutil.move(localPath, path)
+    return path
+
+
+def describe(metadata):
+    """Text shown under the comment of a version."""
+    lines = ["{0:.1f} MB, {1} nodes, saved in {2}s".format(
+        metadata.get("size", 0) / 1e6, metadata.get("nodes", "?"), metadata.get("save_duration", "?"))]
+    if(metadata.get("frame_range")):
+        lines.append("Frames {0:g} - {1:g}".format(*metadata["frame_range"]))
+    lines.append("{0}, {1}".format(metadata.get("author", "?"), metadata.get("houdini", "?")))
+    return '\n'.join(lines)
@@ -0,0 +1,139 @@
+"""Retention policy for the versioned .hip files of a shot folder.
+
+Decides which versions to keep and moves the others to an archive folder, with
+their comments, metadata and snapshots. Always look at the dry run first:
+    python version_retention.py C:/Path/To/Shot
+    python version_retention.py C:/Path/To/Shot --keep-last 10 --daily-after 14
+    python version_retention.py C:/Path/To/Shot --apply
+
+Versions in the deduplicated store (see hip_store) are rebuilt as plain files
+in the archive, then their unused chunks are freed.
+"""
+import os, sys, time, shutil, argparse
+from dataclasses import dataclass
+import hip_store
+from version_index import get_index
+from journal_store import get_store, comment_store
+
+ArchiveDir = "_archive"
+# Folder of the viewport snapshots, see version_metadata.
+SnapshotDir = ".snapshots"
+
+
+@dataclass
+class RetentionPolicy:
+    """Which versions of each file name are kept. A version is kept if any rule keeps it."""
+    # Always keep the latest versions.
+    keep_last: int = 5
+    # Keep every version with a comment.
+    keep_commented: bool = True
+    # Past this many days, keep only the last version of each day.
+    daily_after: int = 7
+
+
+def version_time(directory, filename):
+    path = os.path.join(directory, filename)
+    if not os.path.exists(path):
+        path = hip_store.manifest_path(directory, filename)
+    return os.path.getmtime(path)
+
+
+def plan(directory, policy=None, now=None):
+    """Return [(filename, keep, reason)] for every version of DIRECTORY, without touching anything."""
+    policy = policy or RetentionPolicy()
+    now = now or time.time()
+    index = get_index(directory)
+    comments = comment_store(directory).all()
+    decisions = []
+    for name in index.names():
+        versions = index.all_versions(name)
+        filenames = [os.path.basename(index.path(name, version)) for version in versions]
+        day_of = {}
+        for filename in filenames:
+            day_of[filename] = time.strftime("%Y-%m-%d", time.localtime(version_time(directory, filename)))
+        # Versions are oldest first, so this ends up with the last version of each day.
+        last_of_day = dict((day, filename) for filename, day in day_of.items())
+
+        for i, (version, filename) in enumerate(zip(versions, filenames)):
+            if i >= len(versions) - policy.keep_last:
+                decisions.append((filename, True, "latest {0}".format(policy.keep_last)))
+            elif policy.keep_commented and comments.get(name + "_v" + version):
+                decisions.append((filename, True, "has a comment"))
+            elif now - version_time(directory, filename) < policy.daily_after * 86400:
+                decisions.append((filename, True, "newer than {0} days".format(policy.daily_after)))
+            elif last_of_day[day_of[filename]] == filename:
+                decisions.append((filename, True, "last of " + day_of[filename]))
+            else:
+                decisions.append((filename, False, "older than {0} days".format(policy.daily_after)))
+    return decisions
+
+
+def report(decisions):
+    lines = []
+    for filename, keep, reason in decisions:
+        lines.append("{0:8} {1}  ({2})".format("keep" if keep else "archive", filename, reason))
+    pruned = sum(1 for d in decisions if not d[1])
+    lines.append("{0} of {1} versions would be archived".format(pruned, len(decisions)))
+    return "\n".join(lines)
+
+
+def _move(source, destination):
+    if not os.path.exists(os.path.dirname(destination)):
+        os.makedirs(os.path.dirname(destination))
+    # A plain rename when the archive is on the same drive, a copy otherwise.
+    shutil.move(source, destination)
+
+
+def apply(directory, decisions, archive=None):
+    """Move the versions the plan doesn't keep to ARCHIVE (DIRECTORY/_archive by default). Returns the moved files."""
+    archive = archive or os.path.join(directory, ArchiveDir)
+    index = get_index(directory)
+    stores = [(get_store(directory, name), get_store(archive, name)) for name in ("comments", "metadata")]
+    moved = []
+    stored = False
+    for filename, keep, reason in decisions:
+        if keep:
+            continue
+        path = os.path.join(directory, filename)
+        if os.path.exists(path):
+            _move(path, os.path.join(archive, filename))
+        else:
+            hip_store.restore(directory, filename, os.path.join(archive, filename))
+            hip_store.remove_version(directory, filename)
+            stored = True
+
+        key = os.path.splitext(filename)[0]
+        snapshot = os.path.join(directory, SnapshotDir, key + ".jpg")
+        if os.path.exists(snapshot):
+            _move(snapshot, os.path.join(archive, SnapshotDir, key + ".jpg"))
+        # The comment and metadata follow the file into the archive.
+        for store, archive_store in stores:
+            value = store.get(key)
+            if value is not None:
+                archive_store.set(key, value)
+                store.set(key, None)
+        index.remove(filename)
+        moved.append(filename)
+
+    if stored:
+        hip_store.collect_garbage(directory)
+    return moved
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive old versions of a shot folder. Dry run unless --apply.")
+    parser.add_argument("directory")
+    parser.add_argument("--keep-last", type=int, default=RetentionPolicy.keep_last)
+    parser.add_argument("--no-keep-commented", action="store_true")
+    parser.add_argument("--daily-after", type=int, default=RetentionPolicy.daily_after)
+    parser.add_argument("--archive", help="Where to move the versions (default: <directory>/_archive)")
+    parser.add_argument("--apply", action="store_true", help="Move the files instead of only reporting")
+    args = parser.parse_args()
+
+    if get_index(args.directory) is None:
+        sys.exit("{0} is not a folder".format(args.directory))
+    decisions = plan(args.directory, RetentionPolicy(args.keep_last, not args.no_keep_commented, args.daily_after))
+    print(report(decisions))
+    if args.apply:
+        moved = apply(args.directory, decisions, args.archive)
+        print("Archived {0} versions".format(len(moved)))
@@ -0,0 +1,135 @@
+"""Keeps the version indexes of the folders open in the Load and Save dialogs up to date.
+
+Local folders are watched with a QFileSystemWatcher, so a new or deleted
+version shows up as soon as it lands. Network folders (UNC paths, mapped
+network drives, NFS/SMB mounts) don't reliably report changes, so they are
+polled instead: every PollInterval the folder mtime is checked, which is a
+single stat while nothing changes.
+"""
+from PySide2 import QtCore
+import os
+import hip_store
+from version_index import get_index
+
+# Milliseconds between two checks of a network folder.
+PollInterval = 2000
+NetworkFilesystems = ("nfs", "nfs4", "cifs", "smbfs", "smb3", "fuse.sshfs", "afpfs")
+
+
+def normalize(path):
+    """Key of a folder, the same whatever its slashes or (on Windows) case."""
+    return os.path.normcase(os.path.normpath(os.path.abspath(path)))
+
+
+def is_network_path(path):
+    path = os.path.abspath(path)
+    if path.startswith(('\\\\', '//')):
+        return True
+    if os.name == "nt":
+        import ctypes
+        # DRIVE_REMOTE
+        return ctypes.windll.kernel32.GetDriveTypeW(os.path.splitdrive(path)[0] + '\\') == 4
+    try:
+        with open("/proc/mounts", "r") as f:
+            mounts = [line.split()[1:3] for line in f]
+    except OSError:
+        return False
+    # The filesystem of the longest mount point the path is under.
+    mount, fstype = max((m for m in mounts if path == m[0] or path.startswith(m[0].rstrip('/') + '/')),
+                        key=lambda m: len(m[0]), default=("/", ""))
+    return fstype in NetworkFilesystems
+
+
+class VersionWatcher(QtCore.QObject):
+    """Refreshes the index of the watched folders when they change and tells the dialogs."""
+
+    # Directory whose versions changed.
+    changed = QtCore.Signal(str)
+
+    def __init__(self, parent=None):
+        super(VersionWatcher, self).__init__(parent)
+        self.watcher = QtCore.QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(self.check)
+        self.pollTimer = QtCore.QTimer(self)
+        self.pollTimer.timeout.connect(self.poll)
+        # normalize(directory) -> [number of dialogs watching it, polled, last seen index generation, directory]
+        self.directories = {}
+
+    def watch(self, directory):
+        index = get_index(directory)
+        if(index is None):
+            return
+        key = normalize(directory)
+        if(key in self.directories):
+            self.directories[key][0] += 1
+            return
+        polled = is_network_path(directory)
+        self.directories[key] = [1, polled, index.generation, directory]
+        if(polled):
+            if(not self.pollTimer.isActive()):
+                self.pollTimer.start(PollInterval)
+        else:
+            self.watcher.addPath(directory)
+            self.watchStore(directory)
+
+    def watchStore(self, directory):
+        #Deduplicated versions land in the store, not in the folder itself
+        manifests = os.path.join(hip_store.store_path(directory), "manifests")
+        if(os.path.isdir(manifests) and manifests not in self.watcher.directories()):
+            self.watcher.addPath(manifests)
+
+    def unwatch(self, directory):
+        key = normalize(directory)
+        entry = self.directories.get(key)
+        if(entry is None):
+            return
+        entry[0] -= 1
+        if(entry[0] > 0):
+            return
+        del self.directories[key]
+        #Removed with the spelling it was added with
+        directory = entry[3]
+        if(not entry[1]):
+            self.watcher.removePath(directory)
+            manifests = os.path.join(hip_store.store_path(directory), "manifests")
+            if(manifests in self.watcher.directories()):
+                self.watcher.removePath(manifests)
+        if(not any(entry[1] for entry in self.directories.values())):
+            self.pollTimer.stop()
+
+    def check(self, path):
+        #Changes in the store are reported for the shot folder
+        path = normalize(path)
+        for key in list(self.directories):
+            if(path == key or os.path.dirname(os.path.dirname(path)) == key):
+                self.refresh(key)
+
+    def poll(self):
+        for key, entry in list(self.directories.items()):
+            if(entry[1]):
+                self.refresh(key)
+
+    def refresh(self, key):
+        entry = self.directories.get(key)
+        #A dialog told of an earlier change may have stopped watching it
+        if(entry is None):
+            return
+        directory = entry[3]
+        index = get_index(directory)
+        if(not entry[1]):
+            self.watchStore(directory)
+        if(index is None or index.generation == entry[2]):
+            return
+        entry[2] = index.generation
+        self.changed.emit(directory)
+
+
+_watcher = None
+
+
+def get_watcher():
+    """The watcher shared by every dialog of the session."""
+    global _watcher
+    if(_watcher is None):
+        _watcher = VersionWatcher()
+    return _watcher